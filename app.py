@@ -2,7 +2,7 @@ from dash import Dash, dcc, html, callback
 import dash_bootstrap_components as dbc
 import dash_mantine_components as dmc
 from dash.dependencies import Input, Output
-from flask import Flask
+from flask import Flask, jsonify
 import plotly.graph_objs as go
 import pandas as pd
 from sqlalchemy.orm import Session
@@ -10,6 +10,7 @@ from layouts.sidebar import sidebar
 from layouts.index_layout import index_layout
 from layouts.category_layout import category_layout
 from layouts.overview_layout import overview_layout
+from data import query_cache
 import matplotlib
 
 
@@ -19,6 +20,13 @@ matplotlib.use('Agg')
 # Initialize Flask server
 server = Flask(__name__)
 
+
+@server.route('/stats/cache')
+def cache_stats():
+    # hit ratio and memory of the dashboard query cache
+    return jsonify(query_cache.cache_stats())
+
+
 # Initialize Dash app
 app = Dash(__name__,
            server=server,
@@ -50,15 +58,16 @@ app.layout = dmc.MantineProvider(
     [Input('url', 'pathname')]
 )
 def display_page(pathname):
+    # each layout is built from the current data generation and reused until the next one is published
     print(pathname)
     if pathname == '/dashboard':
-        return index_layout
+        return index_layout()
     elif pathname == '/dashboard/view':
-        return overview_layout
+        return overview_layout()
     elif pathname == '/dashboard/categories':
-        return category_layout
+        return category_layout()
     else:
-        return index_layout
+        return index_layout()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,258 @@
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from email.utils import parsedate_to_datetime
+import requests
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
+from data.rate_limiter import limiter
+from data.json_stream import iter_json_array
+from data import replay_server, shared_cache
+
+
+# point at data.replay_server for offline runs and benchmarks
+COINGECKO_API = os.getenv('COINGECKO_API_URL', 'https://api.coingecko.com/api/v3').rstrip('/')
+
+# connection pool shared by the scheduler jobs and the concurrent ingestion engine
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 16
+DEFAULT_TIMEOUT = 10
+# used after a 429 when the response carries no Retry-After header
+DEFAULT_RETRY_AFTER = 30
+STREAM_CHUNK_SIZE = 64 * 1024
+# completed responses are shared with identical requests made within this many seconds
+COALESCE_WINDOW = 5
+
+_session = None
+_session_lock = threading.Lock()
+
+# single-flight state: request key -> Future of the parsed payload
+_inflight = {}
+_recent = {}  # request key -> (finished_at, payload)
+_inflight_lock = threading.Lock()
+coalesce_stats = {"requests": 0, "coalesced": 0}
+
+# conditional-request cache: request key -> validators, freshness and the last parsed payload,
+# kept in the cross-process store with CACHE_BACKEND=shared so every worker reuses one download
+if shared_cache.ENABLED:
+    response_cache = shared_cache.SharedCache('api_responses', ttl=3600)
+else:
+    response_cache = TTLCache(maxsize=500, ttl=3600)
+_cache_lock = threading.Lock()
+cache_stats = {"hits": 0, "misses": 0, "revalidated": 0, "bytes_downloaded": 0, "bytes_saved": 0}
+
+# changed is False when the payload was served from cache or confirmed by a 304
+ApiResult = namedtuple('ApiResult', ['payload', 'changed'])
+
+
+def get_session():
+    # one keep-alive session per process, created lazily
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({'Accept': 'application/json'})
+                _session = session
+    return _session
+
+
+def retry_after_seconds(response):
+    value = response.headers.get('Retry-After')
+    try:
+        return max(float(value), 1.0)
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+def get(url, params=None, timeout=DEFAULT_TIMEOUT, headers=None, stream=False):
+    # every outgoing call takes a token from the process-wide bucket first
+    waited = limiter.acquire()
+    if waited > 1:
+        logging.info(f"Waited {waited:.1f}s for rate limit budget before calling {url}")
+    response = get_session().get(url, params=params, timeout=timeout, headers=headers,
+                                  stream=stream)
+    if response.status_code == 429:
+        limiter.pause(retry_after_seconds(response))
+    return response
+
+
+def request_key(url, params=None):
+    return url, tuple(sorted((params or {}).items()))
+
+
+def parse_cache_control(value):
+    directives = {}
+    for part in (value or '').split(','):
+        name, _, arg = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = arg.strip('"')
+    return directives
+
+
+def freshness_seconds(response):
+    # how long the response may be reused without asking the server again
+    directives = parse_cache_control(response.headers.get('Cache-Control'))
+    if 'no-cache' in directives or 'no-store' in directives:
+        return 0
+    if 'max-age' in directives:
+        try:
+            return max(int(directives['max-age']) - int(response.headers.get('Age', 0)), 0)
+        except ValueError:
+            return 0
+    expires = response.headers.get('Expires')
+    if expires:
+        try:
+            return max(parsedate_to_datetime(expires).timestamp() - time.time(), 0)
+        except (TypeError, ValueError):
+            return 0
+    return 0
+
+
+def _fetch_json(url, params, timeout, use_cache=True):
+    key = request_key(url, params)
+    with _cache_lock:
+        entry = response_cache.get(key) if use_cache else None
+        if entry and time.time() < entry['fresh_until']:
+            cache_stats["hits"] += 1
+            cache_stats["bytes_saved"] += entry['size']
+            return ApiResult(entry['payload'], False)
+
+    headers = {}
+    if entry:
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    response = get(url, params=params, timeout=timeout, headers=headers)
+    if response.status_code == 304 and entry:
+        # not modified: no body to download or parse, and nothing new to write
+        with _cache_lock:
+            entry['fresh_until'] = time.time() + freshness_seconds(response)
+            response_cache[key] = entry
+            cache_stats["revalidated"] += 1
+            cache_stats["bytes_saved"] += entry['size']
+        return ApiResult(entry['payload'], False)
+
+    response.raise_for_status()
+    payload = response.json()
+    if replay_server.RECORD_DIR:
+        replay_server.record_response(url, params, response.content)
+    with _cache_lock:
+        cache_stats["misses"] += 1
+        cache_stats["bytes_downloaded"] += len(response.content)
+        if use_cache and 'no-store' not in parse_cache_control(response.headers.get('Cache-Control')):
+            response_cache[key] = {
+                'payload': payload,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'fresh_until': time.time() + freshness_seconds(response),
+                'size': len(response.content),
+            }
+    return ApiResult(payload, True)
+
+
+def fetch_json_result(url, params=None, timeout=DEFAULT_TIMEOUT, use_cache=True):
+    # concurrent or closely spaced calls for the same url+params share one download,
+    # use_cache=False keeps large one-off payloads (e.g. market pages) out of memory afterwards
+    key = request_key(url, params)
+    with _inflight_lock:
+        coalesce_stats["requests"] += 1
+        recent = _recent.get(key)
+        if recent and time.monotonic() - recent[0] < COALESCE_WINDOW:
+            coalesce_stats["coalesced"] += 1
+            return recent[1]
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = Future()
+            _inflight[key] = future
+        else:
+            coalesce_stats["coalesced"] += 1
+
+    if not leader:
+        return future.result()
+
+    try:
+        result = _fetch_json(url, params, timeout, use_cache)
+    except BaseException as e:
+        with _inflight_lock:
+            del _inflight[key]
+        future.set_exception(e)
+        raise
+    with _inflight_lock:
+        del _inflight[key]
+        if use_cache:
+            _recent[key] = (time.monotonic(), result)
+        # drop expired entries so the map does not grow with every page url
+        for old_key in [k for k, (t, _) in _recent.items() if time.monotonic() - t >= COALESCE_WINDOW]:
+            del _recent[old_key]
+    future.set_result(result)
+    return result
+
+
+def stream_json_items(url, params=None, timeout=DEFAULT_TIMEOUT, validators=None, on_complete=None):
+    # yields the records of a JSON array response as they are parsed off the socket.
+    # validators ({'etag', 'last_modified'} of the version the caller already holds) make the request conditional,
+    # None is returned when the server answers 304. on_complete gets the new validators once the body was consumed.
+    headers = {}
+    if validators:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
+    response = get(url, params=params, timeout=timeout, headers=headers, stream=True)
+    if response.status_code == 304 and headers:
+        response.close()
+        with _cache_lock:
+            cache_stats["revalidated"] += 1
+        return None
+    try:
+        response.raise_for_status()
+    except requests.exceptions.RequestException:
+        response.close()
+        raise
+
+    def chunks():
+        recorded = [] if replay_server.RECORD_DIR else None
+        for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+            if recorded is not None:
+                recorded.append(chunk)
+            yield chunk
+        if recorded is not None:
+            replay_server.record_response(url, params, b''.join(recorded))
+
+    def items():
+        try:
+            yield from iter_json_array(chunks(), encoding=response.encoding or 'utf-8')
+        finally:
+            response.close()
+        with _cache_lock:
+            cache_stats["misses"] += 1
+        if on_complete is not None:
+            etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+            on_complete({'etag': etag, 'last_modified': last_modified} if etag or last_modified else None)
+
+    return items()
+
+
+def response_cache_stats():
+    with _cache_lock:
+        lookups = cache_stats["hits"] + cache_stats["misses"] + cache_stats["revalidated"]
+        return {
+            **cache_stats,
+            "entries": len(response_cache),
+            "hit_ratio": round((cache_stats["hits"] + cache_stats["revalidated"]) / lookups, 3) if lookups else 0.0,
+        }
+
+
+def rate_limit_stats():
+    return limiter.stats()
@@ -0,0 +1,76 @@
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from data.db_manager import Base, MarketData
+from data.bulk_writer import bulk_insert
+from data.normalise import normalise_market_page, frame_records
+
+
+# Compare the old ORM add_all path with data.bulk_writer for market_data rows.
+#   python -m data.bench_bulk_write                                   (temporary SQLite file)
+#   python -m data.bench_bulk_write --url postgresql://sni@localhost:5432/crypto_bench --rows 100,10000
+
+
+def synthetic_coins(count):
+    return [{
+        'id': f'coin-{n}', 'symbol': f'c{n}', 'name': f'Coin {n}', 'image': f'https://img/{n}.png',
+        'current_price': 1.0 + n, 'market_cap': 1e9 / (n + 1), 'market_cap_rank': n + 1,
+        'total_volume': 1e7 / (n + 1), 'high_24h': 1.1 + n, 'low_24h': 0.9 + n, 'price_change_24h': 0.01,
+        'price_change_percentage_24h': 1.5, 'market_cap_change_percentage_24h': -0.4,
+        'circulating_supply': 1e6, 'total_supply': 2e6, 'max_supply': None, 'ath': 2.0 + n,
+        'ath_date': '2024-03-14T07:10:36.635Z', 'atl': 0.1, 'atl_date': '2020-03-13T02:22:55.044Z',
+        'roi': None, 'last_updated': '2024-10-23T08:43:06.000Z',
+    } for n in range(count)]
+
+
+def orm_insert(session_factory, frame):
+    session = session_factory()
+    try:
+        session.add_all([MarketData(**row) for row in frame_records(frame)])
+        session.commit()
+    finally:
+        session.close()
+
+
+def bulk_write(engine, frame):
+    with engine.begin() as connection:
+        bulk_insert(connection, MarketData, frame)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark market_data write paths")
+    parser.add_argument('--url', help="database url, a temporary SQLite file by default")
+    parser.add_argument('--rows', default='100,10000,100000')
+    args = parser.parse_args()
+
+    url = args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_engine(url)
+    session_factory = sessionmaker(bind=engine)
+    Base.metadata.create_all(bind=engine, tables=[MarketData.__table__])
+
+    print(f"{'rows':>8} {'orm rows/s':>12} {'bulk rows/s':>12} {'speedup':>8}   ({engine.dialect.name})")
+    for count in [int(value) for value in args.rows.split(',')]:
+        frame = normalise_market_page(synthetic_coins(count), timestamp=datetime.utcnow())
+        results = {}
+        for label, fn, fn_args in (('orm', orm_insert, (session_factory, frame)), ('bulk', bulk_write, (engine, frame))):
+            with engine.begin() as connection:
+                connection.execute(MarketData.__table__.delete())
+            results[label] = count / timed(fn, *fn_args)
+        print(f"{count:>8} {results['orm']:>12,.0f} {results['bulk']:>12,.0f} {results['bulk'] / results['orm']:>7.1f}x")
+
+    with engine.begin() as connection:
+        connection.execute(MarketData.__table__.delete())
+
+
+if __name__ == '__main__':
+    main()
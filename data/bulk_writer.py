@@ -0,0 +1,99 @@
+import csv
+import io
+import json
+import pandas as pd
+from sqlalchemy import JSON
+from data.normalise import frame_columns
+
+
+# rows per executemany call
+BATCH_SIZE = 5000
+COPY_NULL = '\\N'
+
+
+def insert_columns(table, rows):
+    # columns present in the input, the autoincrement id is left to the database
+    names = list(rows.columns) if isinstance(rows, pd.DataFrame) else list(rows[0].keys()) if rows else []
+    return [table.c[name] for name in table.columns.keys() if name in names and name != 'id']
+
+
+def _copy_value(value, is_json):
+    if value is None or (not isinstance(value, (dict, list, str)) and pd.isna(value)):
+        return COPY_NULL
+    if is_json:
+        return json.dumps(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def _row_tuples(rows, names):
+    if isinstance(rows, pd.DataFrame):
+        return zip(*frame_columns(rows[names]))
+    return (tuple(row.get(name) for name in names) for row in rows)
+
+
+def _copy_cursor_insert(cursor, table, columns, rows):
+    names = [column.name for column in columns]
+    json_flags = [isinstance(column.type, JSON) for column in columns]
+    statement = (f"COPY {table.name} ({', '.join(names)}) FROM STDIN "
+                 f"WITH (FORMAT csv, NULL '{COPY_NULL}')")
+    count = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in _row_tuples(rows, names):
+        writer.writerow([_copy_value(value, is_json) for value, is_json in zip(row, json_flags)])
+        count += 1
+    buffer.seek(0)
+
+    if hasattr(cursor, 'copy_expert'):  # psycopg2
+        cursor.copy_expert(statement, buffer)
+    else:  # psycopg 3
+        with cursor.copy(statement) as copy:
+            while data := buffer.read(1 << 20):
+                copy.write(data)
+    return count
+
+
+def copy_insert(connection, table, rows):
+    # COPY FROM STDIN on the connection's own transaction
+    columns = insert_columns(table, rows)
+    dbapi_connection = connection.connection.dbapi_connection
+    cursor = dbapi_connection.cursor()
+    try:
+        return _copy_cursor_insert(cursor, table, columns, rows)
+    finally:
+        cursor.close()
+
+
+def executemany_insert(connection, table, rows):
+    names = [column.name for column in insert_columns(table, rows)]
+    count = 0
+    batch = []
+    # dicts are built one batch at a time straight from the column lists
+    for row in _row_tuples(rows, names):
+        batch.append(dict(zip(names, row)))
+        if len(batch) >= BATCH_SIZE:
+            connection.execute(table.insert(), batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        connection.execute(table.insert(), batch)
+        count += len(batch)
+    return count
+
+
+def supports_copy(connection):
+    return connection.dialect.name == 'postgresql' and connection.dialect.driver in ('psycopg2', 'psycopg')
+
+
+def bulk_insert(connection, table, rows):
+    # accepts a normalised DataFrame or a list of dicts, returns the number of rows written
+    if rows is None or len(rows) == 0:
+        return 0
+    if hasattr(table, '__table__'):
+        table = table.__table__
+    if supports_copy(connection):
+        return copy_insert(connection, table, rows)
+    # SQLite and other drivers without COPY
+    return executemany_insert(connection, table, rows)
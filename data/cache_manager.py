@@ -1,27 +1,253 @@
+import hashlib
 import os
-import json
+import pickle
+import tempfile
+import threading
 import time
+import pandas as pd
+from cachetools import LRUCache
+from data import shared_cache
 
-# TODO Do it later
-CACHE_DIR = 'cache'
-CACHE_EXPIRY = 3600
+try:  # optional: DataFrames are stored as Parquet when pyarrow is installed
+    import pyarrow
+except ImportError:
+    pyarrow = None
 
-if not os.path.exists(CACHE_DIR):
-    os.makedirs(CACHE_DIR)
 
-def get_cache_filename(key):
-    return os.path.join(CACHE_DIR, f"{key}.json")
+# Two-tier cache: an in-process LRU in front of a size-bounded disk directory.
+# Entries carry their own expiry; DataFrames go to disk as Parquet (pickle without pyarrow), anything else as pickle.
+
+CACHE_DIR = os.getenv('CACHE_DIR', 'cache')
+CACHE_EXPIRY = int(os.getenv('CACHE_EXPIRY', 3600))
+MEMORY_MAX_ENTRIES = int(os.getenv('CACHE_MEMORY_ENTRIES', 256))
+DISK_MAX_BYTES = int(float(os.getenv('CACHE_DISK_MAX_MB', 512)) * 1024 * 1024)
+
+PARQUET = 'parquet'
+PICKLE = 'pkl'
+
+
+def key_digest(key):
+    # keys can hold any characters, file names are a digest of them
+    return hashlib.sha1(str(key).encode()).hexdigest()
+
+
+def entry_filename(digest, expires_at, fmt):
+    # the expiry lives in the file name, so scanning the directory never opens a file
+    return f"{digest}-{int(expires_at)}.{fmt}"
+
+
+def parse_filename(name):
+    try:
+        stem, fmt = name.rsplit('.', 1)
+        digest, expires_at = stem.rsplit('-', 1)
+        return digest, int(expires_at), fmt
+    except ValueError:
+        return None
+
+
+def write_value(path, value):
+    # returns the format actually written
+    if pyarrow is not None and isinstance(value, pd.DataFrame):
+        try:
+            value.to_parquet(path, index=True)
+            return PARQUET
+        except (ValueError, TypeError, NotImplementedError, pyarrow.ArrowException):
+            pass  # object columns Arrow cannot type (e.g. dicts), pickled below
+    with open(path, 'wb') as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return PICKLE
+
+
+def read_value(path, fmt):
+    if fmt == PARQUET:
+        return pd.read_parquet(path)
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+class TwoTierCache:
+    def __init__(self, directory=CACHE_DIR, ttl=CACHE_EXPIRY, memory_entries=MEMORY_MAX_ENTRIES,
+                 disk_max_bytes=DISK_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.disk_max_bytes = disk_max_bytes
+        self.memory = LRUCache(maxsize=memory_entries)  # key -> (expires_at, value)
+        self.index = None  # digest -> {'name', 'expires_at', 'size', 'accessed'}, built on first disk access
+        self.disk_bytes = 0
+        self.lock = threading.RLock()
+        self.stats_counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "expired": 0,
+                               "writes": 0, "evictions": 0}
+
+    # disk tier
+
+    def _load_index(self):
+        # caller holds the lock, the directory is only created when something is written
+        if self.index is not None:
+            return
+        self.index = {}
+        self.disk_bytes = 0
+        if not os.path.isdir(self.directory):
+            return
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith('.tmp-'):
+                # temp file of a write that never finished
+                if entry.stat().st_mtime < time.time() - 3600:
+                    self._remove_file(entry.name)
+                continue
+            parsed = parse_filename(entry.name) if entry.is_file() else None
+            if parsed is None:
+                continue
+            digest, expires_at, fmt = parsed
+            stat = entry.stat()
+            previous = self.index.get(digest)
+            if previous is not None:
+                # left behind by an interrupted replace, keep the newest
+                if previous['expires_at'] >= expires_at:
+                    self._remove_file(entry.name)
+                    continue
+                self._remove_file(previous['name'])
+                self.disk_bytes -= previous['size']
+            self.index[digest] = {'name': entry.name, 'fmt': fmt, 'expires_at': expires_at,
+                                  'size': stat.st_size, 'accessed': stat.st_mtime}
+            self.disk_bytes += stat.st_size
+
+    def _remove_file(self, name):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    def _drop(self, digest):
+        entry = self.index.pop(digest, None)
+        if entry is not None:
+            self._remove_file(entry['name'])
+            self.disk_bytes -= entry['size']
+
+    def _write(self, digest, value, expires_at):
+        os.makedirs(self.directory, exist_ok=True)
+        # write to a temp file in the same directory and rename, readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        os.close(fd)
+        try:
+            fmt = write_value(tmp_path, value)
+            name = entry_filename(digest, expires_at, fmt)
+            os.replace(tmp_path, os.path.join(self.directory, name))
+        except BaseException:
+            self._remove_file(os.path.basename(tmp_path))
+            raise
+        size = os.path.getsize(os.path.join(self.directory, name))
+        previous = self.index.get(digest)
+        if previous is not None and previous['name'] != name:
+            self._remove_file(previous['name'])
+        if previous is not None:
+            self.disk_bytes -= previous['size']
+        self.index[digest] = {'name': name, 'fmt': fmt, 'expires_at': expires_at, 'size': size,
+                              'accessed': time.time()}
+        self.disk_bytes += size
+        self._evict(keep=digest)
+
+    def _evict(self, keep=None):
+        # expired files go first, then the least recently used ones until the directory fits
+        now = time.time()
+        for digest in [d for d, entry in self.index.items() if entry['expires_at'] <= now and d != keep]:
+            self._drop(digest)
+            self.stats_counters["expired"] += 1
+        if self.disk_bytes <= self.disk_max_bytes:
+            return
+        for digest in sorted(self.index, key=lambda d: self.index[d]['accessed']):
+            if self.disk_bytes <= self.disk_max_bytes:
+                break
+            if digest == keep:
+                continue
+            self._drop(digest)
+            self.stats_counters["evictions"] += 1
+
+    # public interface
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self.lock:
+            cached = self.memory.get(key)
+            if cached is not None:
+                expires_at, value = cached
+                if expires_at > now:
+                    self.stats_counters["memory_hits"] += 1
+                    return value
+                del self.memory[key]
+
+            self._load_index()
+            digest = key_digest(key)
+            entry = self.index.get(digest)
+            if entry is None:
+                self.stats_counters["misses"] += 1
+                return default
+            if entry['expires_at'] <= now:
+                self._drop(digest)
+                self.stats_counters["expired"] += 1
+                self.stats_counters["misses"] += 1
+                return default
+            try:
+                value = read_value(os.path.join(self.directory, entry['name']), entry['fmt'])
+            except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+                self._drop(digest)
+                self.stats_counters["misses"] += 1
+                return default
+            entry['accessed'] = now
+            self.memory[key] = (entry['expires_at'], value)
+            self.stats_counters["disk_hits"] += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self.lock:
+            self.memory[key] = (expires_at, value)
+            self._load_index()
+            self._write(key_digest(key), value, expires_at)
+            self.stats_counters["writes"] += 1
+
+    def delete(self, key):
+        with self.lock:
+            self.memory.pop(key, None)
+            self._load_index()
+            self._drop(key_digest(key))
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            self._load_index()
+            for digest in list(self.index):
+                self._drop(digest)
+
+    def purge_expired(self):
+        with self.lock:
+            self._load_index()
+            self._evict()
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.stats_counters)
+            lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+            return {
+                **counters,
+                "memory_entries": len(self.memory),
+                "disk_entries": len(self.index) if self.index is not None else None,
+                "disk_bytes": self.disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes,
+                "hit_ratio": round((counters["memory_hits"] + counters["disk_hits"]) / lookups, 3) if lookups else 0.0,
+            }
+
+
+# process-wide instance, nothing touches the disk until it is used;
+# with CACHE_BACKEND=shared all workers read and write one SQLite store instead
+if shared_cache.ENABLED:
+    cache = shared_cache.SharedCache('cache_manager', ttl=CACHE_EXPIRY)
+else:
+    cache = TwoTierCache()
 
-def set_cache(key, data):
-    cache_file = get_cache_filename(key)
-    with open(cache_file, 'w') as f:
-        json.dump({'timestamp': time.time(), 'data': data}, f)
 
 def get_cache(key):
-    cache_file = get_cache_filename(key)
-    if os.path.exists(cache_file):
-        with open(cache_file, 'r') as f:
-            cache_content = json.load(f)
-            if time.time() - cache_content['timestamp'] < CACHE_EXPIRY:
-                return cache_content['data']
-    return None
+    return cache.get(key)
+
+
+def set_cache(key, data):
+    cache.set(key, data)
@@ -1,9 +1,18 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Text, DateTime, JSON
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy import (
+    create_engine, Column, Integer, String, Float, Text, DateTime, JSON, Table, Index, select, inspect, text, func
+)
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import declarative_base, sessionmaker, scoped_session
 from sqlalchemy.exc import SQLAlchemyError
+from contextlib import contextmanager
 from datetime import datetime
 import os
 import json
+import pandas as pd
+from data.normalise import frame_records
+from data.bulk_writer import bulk_insert
+from data import rollups
+from data.leaderboard import TOP_N, LEADERBOARD_METRICS, GAINER_METRICS, VOLUME_METRIC, LeaderboardBuilder
 
 
 USERNAME = 'sni'
@@ -11,18 +20,93 @@ PASSWORD = ''
 HOST = 'localhost'
 PORT = '5432'
 DB_NAME = 'crypto_data'
-DB_URL = f"postgresql://{USERNAME}:{PASSWORD}@{HOST}:{PORT}/{DB_NAME}"
+DB_URL = os.getenv('DATABASE_URL', f"postgresql://{USERNAME}:{PASSWORD}@{HOST}:{PORT}/{DB_NAME}")
+
+# connection pool settings per kind of process, picked with DB_PROFILE (writes) and DB_READ_PROFILE (dashboard reads)
+ENGINE_PROFILES = {
+    # many short dashboard reads from Flask request threads
+    'web': {'pool_size': 10, 'max_overflow': 20, 'pool_timeout': 10},
+    # ingestion and the scheduler: a few long write transactions
+    'worker': {'pool_size': 4, 'max_overflow': 4, 'pool_timeout': 30},
+    # local debugging, logs every statement
+    'debug': {'pool_size': 2, 'max_overflow': 0, 'pool_timeout': 30, 'echo': True},
+}
+ENGINE_DEFAULTS = {
+    'pool_pre_ping': True,  # drop connections the server closed while they sat in the pool
+    'pool_recycle': 1800,
+    'query_cache_size': 500,  # compiled statement cache
+    'echo': False,
+}
+# environment overrides applied on top of the profile
+ENGINE_ENV_OVERRIDES = {
+    'DB_POOL_SIZE': ('pool_size', int),
+    'DB_MAX_OVERFLOW': ('max_overflow', int),
+    'DB_POOL_TIMEOUT': ('pool_timeout', float),
+    'DB_POOL_RECYCLE': ('pool_recycle', int),
+    'DB_POOL_PRE_PING': ('pool_pre_ping', lambda value: value.lower() in ('1', 'true', 'yes')),
+    'DB_STATEMENT_CACHE_SIZE': ('query_cache_size', int),
+    'DB_ECHO': ('echo', lambda value: value.lower() in ('1', 'true', 'yes')),
+}
+POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout')
+
+
+def engine_options(profile):
+    if profile not in ENGINE_PROFILES:
+        raise ValueError(f"Unknown engine profile {profile!r}, expected one of {', '.join(ENGINE_PROFILES)}")
+    options = {**ENGINE_DEFAULTS, **ENGINE_PROFILES[profile]}
+    for variable, (option, convert) in ENGINE_ENV_OVERRIDES.items():
+        if os.getenv(variable):
+            options[option] = convert(os.getenv(variable))
+    return options
+
+
+def create_db_engine(profile, url=None):
+    url = make_url(url or DB_URL)
+    options = engine_options(profile)
+    if url.get_backend_name() == 'sqlite':
+        # SQLite picks its own pool class, which takes none of the sizing options
+        options = {key: value for key, value in options.items() if key not in POOL_OPTIONS}
+    return create_engine(url, **options)
+
 
 Base = declarative_base()
 
 # Define the engine and session
-engine = create_engine(DB_URL, echo=True)
+engine = create_db_engine(os.getenv('DB_PROFILE', 'worker'))
+# writes get a session per publish cycle rather than per thread: a refresh DAG cycle hands its session from
+# the thread that opened it to the write nodes on other pool threads, a thread-local registry would split it
 SessionLocal = sessionmaker(bind=engine)
 
+# dashboard reads use their own pool, so web threads and the scheduler never wait on each other's connections
+read_engine = create_db_engine(os.getenv('DB_READ_PROFILE', 'web'))
+if read_engine.dialect.name == 'postgresql':
+    read_engine = read_engine.execution_options(postgresql_readonly=True)
+ReadSession = scoped_session(sessionmaker(bind=read_engine, autoflush=False, expire_on_commit=False))
+
+
+@contextmanager
+def read_only_session():
+    # thread-local session on the read pool, nothing is ever flushed or committed,
+    # the connection goes back to the pool as soon as the block ends
+    session = ReadSession()
+    try:
+        yield session
+    finally:
+        ReadSession.remove()
+
 
 class MarketData(Base):
     __tablename__ = 'market_data'
+    __table_args__ = (
+        Index('ix_market_data_coin_id', 'coin_id'),
+        Index('ix_market_data_symbol', 'symbol'),
+        Index('ix_market_data_timestamp', 'timestamp'),
+        # ranking queries read these top-down with LIMIT instead of sorting the table
+        Index('ix_market_data_mcap_change_24h', 'market_cap_change_percentage_24h'),
+        Index('ix_market_data_total_volume', 'total_volume'),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
+    coin_id = Column(String)  # CoinGecko id, symbols are not unique
     symbol = Column(String)
     name = Column(String)
     image = Column(String)
@@ -49,12 +133,14 @@ class MarketData(Base):
     roi = Column(JSON, nullable=True)
     last_updated = Column(DateTime)
     price_change_percentage_1h = Column(Float, nullable=True)
+    price_change_percentage_7d = Column(Float, nullable=True)
     sparkline_in_7d = Column(JSON, nullable=True)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
 
 class GlobalData(Base):
     __tablename__ = 'global_data'
+    __table_args__ = (Index('ix_global_data_timestamp', 'timestamp'),)
     id = Column(Integer, primary_key=True, autoincrement=True)
     active_cryptocurrencies = Column(Integer)
     upcoming_icos = Column(Integer)
@@ -71,6 +157,7 @@ class GlobalData(Base):
 
 class MarketDominance(Base):
     __tablename__ = 'market_dominance'
+    __table_args__ = (Index('ix_market_dominance_timestamp', 'timestamp'),)
     id = Column(Integer, primary_key=True, autoincrement=True)
     btc = Column(Float)
     eth = Column(Float)
@@ -85,6 +172,7 @@ class MarketDominance(Base):
 
 class TrendingCoins(Base):
     __tablename__ = 'trending_coins'
+    __table_args__ = (Index('ix_trending_coins_timestamp', 'timestamp'),)
     id = Column(Integer, primary_key=True, autoincrement=True)
     coin_id = Column(String)
     coin_name = Column(String)
@@ -100,6 +188,10 @@ class TrendingCoins(Base):
 
 class Categories(Base):
     __tablename__ = 'categories'
+    __table_args__ = (
+        Index('ix_categories_category_id', 'category_id'),
+        Index('ix_categories_timestamp', 'timestamp'),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     category_id = Column(String)
     name = Column(String)
@@ -126,6 +218,24 @@ class TopGainersMarketCap(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
 
 
+class Leaderboard(Base):
+    # top/bottom-N per window and metric, see data.leaderboard
+    __tablename__ = 'leaderboards'
+    __table_args__ = (Index('ix_leaderboards_metric_direction', 'metric', 'direction', 'rank'),)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    data_period = Column(String)
+    metric = Column(String)
+    direction = Column(String)
+    rank = Column(Integer)
+    coin_id = Column(String)
+    name = Column(String)
+    symbol = Column(String)
+    value = Column(Float)
+    current_price = Column(Float)
+    market_cap = Column(Float)
+    timestamp = Column(DateTime, default=datetime.utcnow)
+
+
 class TopProjectsByVolume(Base):
     __tablename__ = 'top_projects_by_volume'
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -137,187 +247,555 @@ class TopProjectsByVolume(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
 
 
-def initialize_db():
-    print("Creating tables if they do not exist...")
-    Base.metadata.create_all(bind=engine)
+def history_table(model):
+    # append-only copy of a snapshot table, range partitioned by day on PostgreSQL (see data.history)
+    name = f"{model.__tablename__}_history"
+    columns = [Column(column.name, column.type, nullable=column.name != 'timestamp')
+               for column in model.__table__.columns if column.name != 'id']
+    return Table(name, Base.metadata, *columns, Index(f"ix_{name}_timestamp", 'timestamp'),
+                 postgresql_partition_by='RANGE (timestamp)')
+
+
+# dataset -> history table, the snapshot tables themselves remain the "latest" view used by the dashboard
+HISTORY_TABLES = {
+    'market_data': history_table(MarketData),
+    'global_data': history_table(GlobalData),
+    'market_dominance': history_table(MarketDominance),
+    'category_data': history_table(Categories),
+}
+
+
+class MarketDataRollup(Base):
+    # 1h/1d OHLC buckets per coin, maintained by update_rollups as snapshots are written (see data.rollups)
+    __tablename__ = 'market_data_rollup'
+    __table_args__ = (
+        Index('ux_market_data_rollup_bucket', 'resolution', 'coin_id', 'bucket_start', unique=True),
+        Index('ix_market_data_rollup_range', 'resolution', 'bucket_start'),
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    coin_id = Column(String, nullable=False)
+    resolution = Column(String, nullable=False)
+    bucket_start = Column(DateTime, nullable=False)
+    price_open = Column(Float)
+    price_high = Column(Float)
+    price_low = Column(Float)
+    price_close = Column(Float)
+    market_cap_open = Column(Float)
+    market_cap_high = Column(Float)
+    market_cap_low = Column(Float)
+    market_cap_close = Column(Float)
+    volume = Column(Float)
+    volume_sum = Column(Float)
+    samples = Column(Integer)
+    first_at = Column(DateTime)
+    last_at = Column(DateTime)
+
+
+class IngestionCheckpoint(Base):
+    __tablename__ = 'ingestion_checkpoint'
+    name = Column(String, primary_key=True)
+    last_page = Column(Integer)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class DataGeneration(Base):
+    # one row per published refresh, readers use the latest id to tell snapshots apart
+    __tablename__ = 'data_generation'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    datasets = Column(JSON)
+    published_at = Column(DateTime, default=datetime.utcnow)
 
 
-# initialize the database
-initialize_db()
+_initialized = False
 
 
-# insert data functions
-def insert_market_data(market_data):
+def initialize_db():
+    # called by the ingestion runner and the scheduler, the DDL runs once per process
+    global _initialized
+    if _initialized:
+        return
+    print("Creating tables if they do not exist...")
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+    create_missing_indexes()
+    _initialized = True
+
+
+def add_missing_columns():
+    # create_all does not alter existing tables, add nullable columns introduced since they were created
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                    print(f"Added column {table.name}.{column.name}")
+
+
+def create_missing_indexes():
+    # create_all only indexes tables it creates, existing deployments get the declared indexes here
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=connection, checkfirst=True)
+
+
+# natural key used to match incoming rows against stored ones
+NATURAL_KEYS = {
+    'market_data': 'coin_id',
+    'categories': 'category_id',
+}
+UPSERT_IGNORED_COLUMNS = ('id', 'timestamp')
+
+
+class SnapshotUpsert:
+    # writes only new and changed rows of a snapshot, optionally deletes rows missing from it.
+    # keys limits the stored rows read back to those natural keys (one page of a paginated walk),
+    # prune() needs the whole table and is only available without it
+    def __init__(self, session, model, keys=None):
+        self.session = session
+        self.model = model
+        self.key = NATURAL_KEYS[model.__tablename__]
+        self.columns = [column.name for column in model.__table__.columns if column.name != 'id']
+        self.compare_columns = [name for name in self.columns if name not in UPSERT_IGNORED_COLUMNS]
+        self.partial = keys is not None
+        table = model.__table__
+        statement = select(table.c.id, *[table.c[name] for name in self.compare_columns])
+        if keys is None:
+            results = [session.execute(statement)]
+        else:
+            keys = list({key for key in keys if key is not None})
+            results = (session.execute(statement.where(table.c[self.key].in_(keys[start:start + 1000])))
+                       for start in range(0, len(keys), 1000))
+        self.existing = {}
+        self.orphan_ids = []  # rows written before the natural key existed, they can never match
+        for rows in results:
+            for row in rows:
+                if row._mapping[self.key] is None:
+                    self.orphan_ids.append(row._mapping['id'])
+                else:
+                    self.existing[row._mapping[self.key]] = row._mapping
+        self.seen = set()
+        self.counts = {"inserted": 0, "updated": 0, "skipped": 0, "deleted": 0}
+
+    def add(self, rows):
+        inserts, updates = [], []
+        for row in rows:
+            row = {name: row[name] for name in self.columns if name in row}
+            natural_key = row.get(self.key)
+            if natural_key is None or natural_key in self.seen:
+                self.counts["skipped"] += 1
+                continue
+            self.seen.add(natural_key)
+            stored = self.existing.get(natural_key)
+            if stored is None:
+                inserts.append(row)
+            elif any(stored[name] != row[name] for name in self.compare_columns if name in row):
+                updates.append({**row, 'id': stored['id']})
+            else:
+                self.counts["skipped"] += 1
+        if inserts:
+            bulk_insert(self.session.connection(), self.model, inserts)
+        if updates:
+            self.session.bulk_update_mappings(self.model, updates)
+        self.counts["inserted"] += len(inserts)
+        self.counts["updated"] += len(updates)
+        return self.counts
+
+    def prune(self, keep=None):
+        # delete stored rows that are not part of the snapshot
+        if self.partial:
+            raise ValueError("prune() needs every stored row, create the SnapshotUpsert without keys")
+        keep = self.seen if keep is None else keep
+        stale_ids = [stored['id'] for natural_key, stored in self.existing.items() if natural_key not in keep]
+        stale_ids += self.orphan_ids
+        for start in range(0, len(stale_ids), 1000):
+            chunk = stale_ids[start:start + 1000]
+            self.session.query(self.model).filter(self.model.id.in_(chunk)).delete(synchronize_session=False)
+        self.counts["deleted"] += len(stale_ids)
+        return self.counts
+
+
+def append_history(session, dataset, rows):
+    # every published snapshot is appended, history rows are never updated or deleted individually
+    now = datetime.utcnow()
+    rows = [{**row, 'timestamp': row.get('timestamp') or now} for row in rows]
+    return bulk_insert(session.connection(), HISTORY_TABLES[dataset], rows)
+
+
+def update_rollups(session, records):
+    # only the buckets this snapshot falls into are read back and merged, raw history is never rescanned
+    now = datetime.utcnow()
+    table = MarketDataRollup.__table__
+    inserted = updated = 0
+    for resolution in rollups.RESOLUTIONS:
+        by_bucket = {}
+        for row in records:
+            if row.get('coin_id') is None:
+                continue
+            timestamp = row.get('timestamp') or now
+            by_bucket.setdefault(rollups.bucket_start(timestamp, resolution), {})[row['coin_id']] = (row, timestamp)
+
+        for bucket_start, rows in by_bucket.items():
+            coin_ids = list(rows)
+            stored = {}
+            for chunk_start in range(0, len(coin_ids), 1000):
+                chunk = coin_ids[chunk_start:chunk_start + 1000]
+                result = session.execute(select(table).where(
+                    table.c.resolution == resolution, table.c.bucket_start == bucket_start, table.c.coin_id.in_(chunk)))
+                stored.update({bucket.coin_id: dict(bucket._mapping) for bucket in result})
+
+            inserts, updates = [], []
+            for coin_id, (row, timestamp) in rows.items():
+                if coin_id in stored:
+                    updates.append(rollups.merge_bucket(stored[coin_id], row, timestamp))
+                else:
+                    inserts.append({**rollups.new_bucket(row, timestamp), 'coin_id': coin_id,
+                                    'resolution': resolution, 'bucket_start': bucket_start})
+            if inserts:
+                bulk_insert(session.connection(), table, inserts)
+            if updates:
+                session.bulk_update_mappings(MarketDataRollup, updates)
+            inserted += len(inserts)
+            updated += len(updates)
+    return {"inserted": inserted, "updated": updated}
+
+
+def market_data_records(market_data):
+    # accepts the normalised DataFrame from data.normalise or an iterable of coin dicts
+    if isinstance(market_data, pd.DataFrame):
+        return frame_records(market_data)
+    return market_data
+
+
+def market_data_leaderboards(market_data):
+    frame = market_data if isinstance(market_data, pd.DataFrame) else pd.DataFrame.from_records(list(market_data))
+    return LeaderboardBuilder().add(frame).boards()
+
+
+def get_checkpoint(name):
     session = SessionLocal()
     try:
-        # clear existing data before inserting
-        session.query(MarketData).delete()
-        session.commit()
-
-        market_data_objects = [MarketData(**{key: coin[key] for key in coin if key != 'id'}) for coin in market_data]
-        session.add_all(market_data_objects)
-        session.commit()
-        print("Market Data Inserted Successfully")
-    except SQLAlchemyError as e:
-        session.rollback()
-        print(f"Error inserting market data: {e}")
+        checkpoint = session.get(IngestionCheckpoint, name)
+        return checkpoint.last_page if checkpoint else None
     finally:
         session.close()
 
 
-def insert_global_data(data):
+def clear_checkpoint(name):
     session = SessionLocal()
     try:
-        session.query(GlobalData).delete()
-        session.commit()
-
-        global_data_obj = GlobalData(**data)
-        session.add(global_data_obj)
+        session.query(IngestionCheckpoint).filter(IngestionCheckpoint.name == name).delete()
         session.commit()
-        print("Global Data Inserted Successfully")
     except SQLAlchemyError as e:
         session.rollback()
-        print(f"Error inserting global data: {e}")
+        print(f"Error clearing checkpoint {name}: {e}")
     finally:
         session.close()
 
 
-def insert_market_dominance(data):
-    session = SessionLocal()
+def prune_market_data(keep_coin_ids, session=None):
+    # after a complete paginated walk, drop coins that are no longer listed;
+    # only (id, coin_id) of the stored universe is read, streamed in batches, never the full rows
+    keep = set(keep_coin_ids)
     try:
-        session.query(MarketDominance).delete()
-        session.commit()
+        with publishing('market_data', session) as session:
+            rows = session.execute(select(MarketData.id, MarketData.coin_id).execution_options(yield_per=1000))
+            stale_ids = [row.id for row in rows if row.coin_id is None or row.coin_id not in keep]
+            for start in range(0, len(stale_ids), 1000):
+                chunk = stale_ids[start:start + 1000]
+                session.query(MarketData).filter(MarketData.id.in_(chunk)).delete(synchronize_session=False)
+        print(f"Market Data Pruned: {len(stale_ids)} rows")
+    except SQLAlchemyError as e:
+        print(f"Error pruning market data: {e}")
+        if session is not None:
+            raise
 
-        market_dominance_object = MarketDominance(**data)
 
-        session.add(market_dominance_object)
-        session.commit()
-        print("Market Dominance Inserted Successfully")
+def append_market_data(market_data, checkpoint=None):
+    # used by paginated ingestion: rows and the page checkpoint are committed together
+    records = market_data_records(market_data)
+    try:
+        with publish_cycle(['market_data']) as session:
+            # only this page's coins are read back, a walk never loads the whole universe per page
+            upsert = SnapshotUpsert(session, MarketData, keys=[record['coin_id'] for record in records])
+            counts = upsert.add(records)
+            append_history(session, 'market_data', records)
+            update_rollups(session, records)
+            if checkpoint:
+                name, last_page = checkpoint
+                session.merge(IngestionCheckpoint(name=name, last_page=last_page, updated_at=datetime.utcnow()))
+        print(f"Market Data Page Upserted Successfully ({len(records)} rows): {counts}")
+        return len(records)
     except SQLAlchemyError as e:
+        print(f"Error inserting market data page: {e}")
+        raise
+
+
+@contextmanager
+def publish_cycle(datasets=()):
+    # one transaction for a whole refresh cycle: every table and the new generation become visible together,
+    # readers keep seeing the previous snapshot until the commit and are never blocked by it
+    session = SessionLocal()
+    session.info['datasets'] = set(datasets)
+    try:
+        yield session
+        if not session.info['datasets']:
+            session.commit()
+            return
+        generation = DataGeneration(datasets=sorted(session.info['datasets']), published_at=datetime.utcnow())
+        session.add(generation)
+        session.commit()
+        print(f"Published generation {generation.id}: {', '.join(generation.datasets)}")
+    except BaseException:
         session.rollback()
-        print(f"Error inserting market dominance: {e}")
+        raise
     finally:
         session.close()
 
 
-def insert_trending_coins(data):
-    session = SessionLocal()
+@contextmanager
+def publishing(dataset, session=None):
+    # write into the caller's publish cycle, or publish this dataset on its own;
+    # inside a cycle each dataset gets a savepoint so a failed write leaves the others intact
+    if session is not None:
+        savepoint = session.begin_nested()
+        try:
+            yield session
+        except BaseException:
+            savepoint.rollback()
+            raise
+        savepoint.commit()
+        session.info.setdefault('datasets', set()).add(dataset)
+    else:
+        with publish_cycle([dataset]) as session:
+            yield session
+
+
+def current_generation():
+    with read_only_session() as session:
+        return session.query(func.max(DataGeneration.id)).scalar() or 0
+
+
+# insert data functions, pass session to write inside a publish_cycle
+def insert_market_data(market_data, session=None):
+    # upsert keyed on coin_id: unchanged coins are not rewritten. Coins outside this batch are kept, the batch is
+    # only the top of the market and the rest of the universe comes from the paginated walk, which alone prunes
     try:
-        session.query(TrendingCoins).delete()
-        session.commit()
+        with publishing('market_data', session) as session:
+            records = market_data_records(market_data)
+            upsert = SnapshotUpsert(session, MarketData, keys=[record['coin_id'] for record in records])
+            counts = upsert.add(records)
+            append_history(session, 'market_data', records)
+            update_rollups(session, records)
+            # leaderboards are ranked from the batch in memory and published with it
+            try:
+                insert_leaderboards(market_data_leaderboards(market_data), session=session)
+            except SQLAlchemyError:
+                # rolled back to their savepoint, market data is still published and the previous boards stay
+                print("Leaderboards were not written this cycle, keeping the previous leaderboards")
+        print(f"Market Data Upserted Successfully: {counts}")
+        return counts
+    except SQLAlchemyError as e:
+        print(f"Error inserting market data: {e}")
+        if session is not None:
+            raise
 
-        # filter the data to match the columns in TrendingCoins
-        filtered_trending_coins = [
-            {
-                key: value for key, value in coin.items()
-                if key in TrendingCoins.__table__.columns.keys()
-            }
-            for coin in data
-        ]
 
-        # create objects for each trending coin
-        trending_coin_objects = [TrendingCoins(**coin) for coin in filtered_trending_coins]
+def insert_global_data(data, session=None):
+    try:
+        with publishing('global_data', session) as session:
+            session.query(GlobalData).delete()
+            session.add(GlobalData(**data))
+            append_history(session, 'global_data', [data])
+        print("Global Data Inserted Successfully")
+    except SQLAlchemyError as e:
+        print(f"Error inserting global data: {e}")
+        if session is not None:
+            raise
 
-        session.add_all(trending_coin_objects)
-        session.commit()
+
+def insert_market_dominance(data, session=None):
+    try:
+        with publishing('market_dominance', session) as session:
+            session.query(MarketDominance).delete()
+            session.add(MarketDominance(**data))
+            append_history(session, 'market_dominance', [data])
+        print("Market Dominance Inserted Successfully")
+    except SQLAlchemyError as e:
+        print(f"Error inserting market dominance: {e}")
+        if session is not None:
+            raise
+
+
+def insert_trending_coins(data, session=None):
+    try:
+        with publishing('trending_data', session) as session:
+            session.query(TrendingCoins).delete()
+
+            # filter the data to match the columns in TrendingCoins
+            filtered_trending_coins = [
+                {
+                    key: value for key, value in coin.items()
+                    if key in TrendingCoins.__table__.columns.keys()
+                }
+                for coin in data
+            ]
+
+            bulk_insert(session.connection(), TrendingCoins, filtered_trending_coins)
         print("Trending Coins Inserted Successfully")
     except SQLAlchemyError as e:
-        session.rollback()
         print(f"Error inserting trending coins: {e}")
-    finally:
-        session.close()
+        if session is not None:
+            raise
 
 
-def insert_category_data(data):
-    session = SessionLocal()
+def insert_category_data(data, session=None):
+    # upsert keyed on category_id
     try:
-        # clear existing data before inserting
-        session.query(Categories).delete()
-        session.commit()
-
-        category_objects = [Categories(**category) for category in data]
-        session.add_all(category_objects)
-        session.commit()
-        print("Category Data Inserted Successfully")
+        with publishing('category_data', session) as session:
+            upsert = SnapshotUpsert(session, Categories)
+            upsert.add(data)
+            counts = upsert.prune()
+            append_history(session, 'category_data', data)
+        print(f"Category Data Upserted Successfully: {counts}")
+        return counts
     except SQLAlchemyError as e:
-        session.rollback()
         print(f"Error inserting category data: {e}")
-    finally:
-        session.close()
+        if session is not None:
+            raise
 
 
-def insert_top_gainers_market_cap():
-    session = SessionLocal()
+def insert_category_batches(batches, session=None):
+    # batches are flushed as they arrive but only become visible when the publish cycle commits
+    count = 0
     try:
+        with publishing('category_data', session) as session:
+            upsert = SnapshotUpsert(session, Categories)
+            for batch in batches:
+                upsert.add(batch)
+                append_history(session, 'category_data', batch)
+                session.flush()
+                count += len(batch)
+            counts = upsert.prune()
+        print(f"Category Data Upserted Successfully ({count} rows): {counts}")
+        return count
+    except SQLAlchemyError as e:
+        print(f"Error inserting category data: {e}")
+        if session is not None:
+            raise
+
+
+def top_gainers_query(limit=TOP_N):
+    # served by ix_market_data_mcap_change_24h, checked by data.schema.check_query_plans
+    column = MarketData.market_cap_change_percentage_24h
+    return select(MarketData).where(column.isnot(None)).order_by(column.desc()).limit(limit)
+
+
+def top_volume_query(limit=TOP_N):
+    # served by ix_market_data_total_volume
+    column = MarketData.total_volume
+    return select(MarketData).where(column.isnot(None)).order_by(column.desc()).limit(limit)
+
+
+def leaderboard_records(boards):
+    now = datetime.utcnow()
+    rows = []
+    for (metric, direction), board in boards.items():
+        for coin in frame_records(board):
+            rows.append({
+                'data_period': LEADERBOARD_METRICS[metric][0],
+                'metric': metric,
+                'direction': direction,
+                'rank': coin['rank'],
+                'coin_id': coin.get('coin_id'),
+                'name': coin.get('name'),
+                'symbol': coin.get('symbol'),
+                'value': coin[metric],
+                'current_price': coin.get('current_price'),
+                'market_cap': coin.get('market_cap'),
+                'timestamp': now,
+            })
+    return rows
+
+
+def insert_leaderboards(boards, session=None):
+    # boards come from data.leaderboard, computed on the market batch before it is written
+    try:
+        with publishing('leaderboards', session) as session:
+            session.query(Leaderboard).delete()
+            bulk_insert(session.connection(), Leaderboard, leaderboard_records(boards))
+            insert_top_gainers_market_cap(boards, session=session)
+            insert_top_projects_by_volume(boards, session=session)
+        print("Leaderboards Inserted Successfully")
+    except SQLAlchemyError as e:
+        print(f"Error inserting leaderboards: {e}")
+        if session is not None:
+            raise
 
-        # top 10 gainers by market cap change percentage in the last 24 hours
-        top_gainers = session.query(MarketData).order_by(MarketData.market_cap_change_percentage_24h.desc()).limit(20).all()
-
-        # clear existing data before inserting
-        session.query(TopGainersMarketCap).delete()
-        session.commit()
 
-        # data for insertion
-        top_gainers_data = [
-            TopGainersMarketCap(
-                name=gainer.name,
-                symbol=gainer.symbol,
-                price=gainer.current_price,
-                change_24h=gainer.price_change_24h,
-                percent_change_7d=gainer.price_change_percentage_1h,  # Assuming this is intended; change if needed
-                market_cap_change_percentage_24h=gainer.market_cap_change_percentage_24h,
-                market_cap=gainer.market_cap,
-                market_cap_dominance=None,  # Set if you have this value in MarketData
-                date_added=gainer.last_updated,  # Assuming `last_updated` is equivalent to `date_added`
-                data_period="24h",  # Assuming you want to set this as "24h"; adjust as necessary
-                timestamp=datetime.utcnow()
-            )
-            for gainer in top_gainers
-        ]
-
-        session.add_all(top_gainers_data)
-        session.commit()
+def insert_top_gainers_market_cap(boards, session=None):
+    try:
+        with publishing('top_gainers_market_cap', session) as session:
+            # clear existing data before inserting
+            session.query(TopGainersMarketCap).delete()
+
+            # top gainers of every window, the dashboard reads the 24h ones
+            top_gainers_data = [
+                TopGainersMarketCap(
+                    name=gainer.get('name'),
+                    symbol=gainer.get('symbol'),
+                    price=gainer.get('current_price'),
+                    change_24h=gainer.get('price_change_24h'),
+                    percent_change_7d=gainer.get('price_change_percentage_7d'),
+                    market_cap_change_percentage_24h=gainer.get('market_cap_change_percentage_24h'),
+                    market_cap=gainer.get('market_cap'),
+                    market_cap_dominance=None,  # Set if you have this value in MarketData
+                    date_added=gainer.get('last_updated'),  # Assuming `last_updated` is equivalent to `date_added`
+                    data_period=period,
+                    timestamp=datetime.utcnow()
+                )
+                for period, metric in GAINER_METRICS.items()
+                if (metric, 'top') in boards
+                for gainer in frame_records(boards[(metric, 'top')])
+            ]
+
+            session.add_all(top_gainers_data)
         print("Top Gainers by Market Cap Inserted Successfully")
 
     except SQLAlchemyError as e:
-        session.rollback()
         print(f"Error inserting top gainers by market cap: {e}")
-    finally:
-        session.close()
+        if session is not None:
+            raise
 
 
-def insert_top_projects_by_volume():
-    session = SessionLocal()
+def insert_top_projects_by_volume(boards, session=None):
     try:
-        # top 10 projects by total volume in the last 24 hours
-        top_volume_projects = session.query(MarketData).order_by(MarketData.total_volume.desc()).limit(20).all()
-
-        # clear existing data before inserting
-        session.query(TopProjectsByVolume).delete()
-        session.commit()
-
-        # data for insertion
-        top_volume_data = [
-            TopProjectsByVolume(
-                name=project.name,
-                symbol=project.symbol,
-                total_volume=project.total_volume,
-                market_cap=project.market_cap,
-                last_updated=project.last_updated,
-                timestamp=datetime.utcnow()
-            )
-            for project in top_volume_projects
-        ]
-
-        session.add_all(top_volume_data)
-        session.commit()
+        with publishing('top_projects_by_volume', session) as session:
+            # clear existing data before inserting
+            session.query(TopProjectsByVolume).delete()
+
+            # data for insertion
+            top_volume_data = [
+                TopProjectsByVolume(
+                    name=project.get('name'),
+                    symbol=project.get('symbol'),
+                    total_volume=project.get('total_volume'),
+                    market_cap=project.get('market_cap'),
+                    last_updated=project.get('last_updated'),
+                    timestamp=datetime.utcnow()
+                )
+                for project in frame_records(boards.get((VOLUME_METRIC, 'top'), pd.DataFrame()))
+            ]
+
+            session.add_all(top_volume_data)
         print("Top Projects by Volume Inserted Successfully")
 
     except SQLAlchemyError as e:
-        session.rollback()
         print(f"Error inserting top projects by volume: {e}")
-    finally:
-        session.close()
-
-
-
+        if session is not None:
+            raise
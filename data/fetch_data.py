@@ -1,8 +1,8 @@
+import hashlib
 import requests
 from dotenv import load_dotenv
 import time
 import logging
-from cachetools import TTLCache
 from typing import Dict, Any, Optional
 from contextlib import contextmanager
 from data import db_manager
@@ -10,50 +10,92 @@ import json
 from datetime import datetime
 from dateutil import parser
 from sqlalchemy.exc import SQLAlchemyError
-
-
-# PostgreSQL details
-USERNAME = 'sni'
-PASSWORD = ''
-HOST = 'localhost'
-PORT = '5432'
-DATABASE = 'crypto_data'
-
-DB_URL = f"postgresql://{USERNAME}:{PASSWORD}@{HOST}:{PORT}/{DATABASE}"
-
-# Initialize the database
-db_manager.initialize_db()
-
-# Cache setup: cache size of 100, expiration time of 1 hour
-cache = TTLCache(maxsize=500, ttl=3600)
-COINGECKO_API = 'https://api.coingecko.com/api/v3'
-
-
-def fetch_data_from_api(url, params: Optional[Dict[str, Any]] = None):
-    retries = 4
-    delay = 10  # Start with a 10-second delay
+from data import api_client
+from data.stale_cache import StaleWhileRevalidate
+from data.normalise import normalise_market_page
+from data.leaderboard import LeaderboardBuilder
+
+
+# conditional-request response cache (ETag / Last-Modified / Cache-Control), see api_client
+cache = api_client.response_cache
+COINGECKO_API = api_client.COINGECKO_API
+
+MARKET_DATA_PARAMS = {
+    'vs_currency': 'usd',
+    'order': 'market_cap_desc',
+    'per_page': 100,
+    'page': 1,
+    # adds price_change_percentage_{1h,24h,7d}_in_currency, used by the leaderboards
+    'price_change_percentage': '1h,24h,7d',
+    # 'sparkline': 'true'  # To fetch sparkline data if needed
+}
+
+# CoinGecko's maximum page size for /coins/markets
+MARKET_PAGE_SIZE = 250
+MARKET_PAGES_CHECKPOINT = 'market_data_pages'
+CATEGORY_BATCH_SIZE = 100
+
+# dataset name -> (endpoint path, query params, request timeout in seconds)
+ENDPOINTS = {
+    'market_data': ('/coins/markets', MARKET_DATA_PARAMS, 15),
+    'global_data': ('/global', None, 10),
+    'trending_data': ('/search/trending', None, 10),
+    'market_dominance': ('/global', None, 10),
+    'category_data': ('/coins/categories', None, 20),
+}
+
+# returned by fetch_data_from_api(only_changed=True) when upstream data has not changed,
+# and by fetch_endpoint when the dataset already stored the fetched payload
+UNCHANGED = object()
+# dataset -> payload hash (streamed datasets: ETag/Last-Modified) of the version its table holds
+stored_versions = {}
+
+
+def fetch_data_from_api(url, params: Optional[Dict[str, Any]] = None, timeout: float = api_client.DEFAULT_TIMEOUT,
+                        only_changed: bool = False, use_cache: bool = True, retries: int = 4):
     if params is None:
         params = {}
 
     for i in range(retries):
         try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            return response.json()
+            result = api_client.fetch_json_result(url, params=params, timeout=timeout, use_cache=use_cache)
+            if only_changed and not result.changed:
+                return UNCHANGED
+            return result.payload
         except requests.exceptions.RequestException as e:
-            if response and response.status_code == 429:  # too Many Requests
-                delay = min(delay * 2, 60)  # Increment the delay up to a max of 60 seconds
-                logging.warning(f"Rate limit hit. Retrying in {delay} seconds... Attempt {i + 1}/{retries}")
-                time.sleep(delay)
+            response = e.response
+            if response is not None and response.status_code == 429:  # too Many Requests
+                # api_client has already paused the shared limiter, the next call waits for it
+                logging.warning(f"Rate limit hit for {url}. Attempt {i + 1}/{retries}")
             else:
-                status_code = response.status_code if response else 'No response'
-                content = response.text if response else 'No response content'
+                status_code = response.status_code if response is not None else 'No response'
+                content = response.text if response is not None else 'No response content'
                 logging.error(f"Failed to fetch data from {url}. Status code: {status_code}. "
                               f"Error: {e}. Response content: {content}")
                 return {}
     return None
 
 
+def stream_records_from_api(url, params: Optional[Dict[str, Any]] = None,
+                            timeout: float = api_client.DEFAULT_TIMEOUT, validators=None, on_complete=None):
+    # streaming counterpart of fetch_data_from_api for endpoints that return a JSON array:
+    # returns an iterator of records, UNCHANGED on a 304, or None when the request failed
+    retries = 4
+    for i in range(retries):
+        try:
+            records = api_client.stream_json_items(url, params=params, timeout=timeout, validators=validators,
+                                                   on_complete=on_complete)
+            return UNCHANGED if records is None else records
+        except requests.exceptions.RequestException as e:
+            response = e.response
+            if response is not None and response.status_code == 429:
+                logging.warning(f"Rate limit hit for {url}. Attempt {i + 1}/{retries}")
+            else:
+                logging.error(f"Failed to stream data from {url}. Error: {e}")
+                return None
+    return None
+
+
 def parse_datetime(date_value: Any) -> Optional[datetime]:
     if isinstance(date_value, int):
         return datetime.utcfromtimestamp(date_value)
@@ -65,67 +107,148 @@ def parse_datetime(date_value: Any) -> Optional[datetime]:
     return None
 
 
-# to fetch  data
-def fetch_market_data():
-    url = f"{COINGECKO_API}/coins/markets"
-    params = {
-        'vs_currency': 'usd',
-        'order': 'market_cap_desc',
-        'per_page': 100,
-        'page': 1,
-        # 'sparkline': 'true'  # To fetch sparkline data if needed
-    }
-    data = fetch_data_from_api(url, params)
+def payload_version(payload):
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
 
-    if data:
-        processed_data = []
-        for coin in data:
-            coin_data = {
-                "symbol": coin.get("symbol"),
-                "name": coin.get("name"),
-                "image": coin.get("image"),
-                "current_price": coin.get("current_price"),
-                "market_cap": coin.get("market_cap"),
-                "market_cap_rank": coin.get("market_cap_rank"),
-                "fully_diluted_valuation": coin.get("fully_diluted_valuation"),
-                "total_volume": coin.get("total_volume"),
-                "high_24h": coin.get("high_24h"),
-                "low_24h": coin.get("low_24h"),
-                "price_change_24h": coin.get("price_change_24h"),
-                "price_change_percentage_24h": coin.get("price_change_percentage_24h"),
-                "market_cap_change_24h": coin.get("market_cap_change_24h"),
-                "market_cap_change_percentage_24h": coin.get("market_cap_change_percentage_24h"),
-                "circulating_supply": coin.get("circulating_supply"),
-                "total_supply": coin.get("total_supply"),
-                "max_supply": coin.get("max_supply"),
-                "ath": coin.get("ath"),
-                "ath_change_percentage": coin.get("ath_change_percentage"),
-                "ath_date": parse_datetime(coin.get("ath_date")),
-                "atl": coin.get("atl"),
-                "atl_change_percentage": coin.get("atl_change_percentage"),
-                "atl_date": parse_datetime(coin.get("atl_date")),
-                "roi": coin.get("roi"),
-                "last_updated": parse_datetime(coin.get("last_updated")),
-                "price_change_percentage_1h": coin.get("price_change_percentage_1h", None),  # Nullable
-                "sparkline_in_7d": coin.get("sparkline_in_7d", None),  # Store as JSON if present
-                "timestamp": datetime.utcnow()
-            }
-            processed_data.append(coin_data)
 
-        # Insert the processed data into the database
-        if data:
-            db_manager.insert_market_data(data)
+def mark_stored(name: str, version):
+    # called once a write of this dataset committed, until then every fetch hands the payload on
+    if version is not None:
+        stored_versions[name] = version
+
+
+def fetch_endpoint(name: str):
+    # UNCHANGED only when this dataset already stored this exact payload: several datasets share an endpoint
+    # (/global), so a cache hit or 304 for the url says nothing about whether this dataset wrote it.
+    # Stale-while-revalidate on `latest`: a payload younger than its `fresh` bound is used without calling upstream.
+    # With an older but servable one, upstream gets a single attempt and nothing waits on a rate-limit pause;
+    # when it fails the stored data is kept (UNCHANGED) and `latest` refreshes in the background. A fallback
+    # payload is never written, it would be appended to history and the rollups as a new snapshot.
+    path, params, timeout = ENDPOINTS[name]
+    cached, age = latest.peek(name)
+    if cached and age < latest.policy(name).fresh:
+        payload = cached
+    elif cached:
+        if api_client.limiter.stats()['paused_for_seconds'] > 0:
+            payload = None
         else:
-            print("API call failed. Keeping the last valid data intact")
+            payload = fetch_data_from_api(f"{COINGECKO_API}{path}", params, timeout=timeout, retries=1)
+        if not payload:
+            logging.warning(f"Fetching {name} failed or is rate limited, keeping stored data "
+                            f"(last good payload is {age:.0f}s old, refreshing in the background)")
+            latest.refresh(name)
+            return UNCHANGED
+        latest.put(name, payload)
+    else:
+        payload = fetch_data_from_api(f"{COINGECKO_API}{path}", params, timeout=timeout)
+        if payload:
+            latest.put(name, payload)
+    if payload and stored_versions.get(name) == payload_version(payload):
+        return UNCHANGED
+    return payload
+
+
+def load_endpoint(name: str):
+    # background loader for `latest`, a failed request (None or {}) keeps the last good payload
+    path, params, timeout = ENDPOINTS[name]
+    return fetch_data_from_api(f"{COINGECKO_API}{path}", params, timeout=timeout) or None
+
+
+# last good payload of every endpoint, fetch_endpoint serves it instead of waiting on the API
+latest = StaleWhileRevalidate(load_endpoint)
+
+
+def store_endpoint(name: str, payload):
+    # an UNCHANGED payload is already stored, skip parsing and the DB rewrite
+    if payload is UNCHANGED:
+        logging.info(f"{name} not modified since it was last stored, keeping stored data")
+        return None
+    rows = PROCESS_FUNCTIONS[name](payload) if payload else None
+    if rows is None or len(rows) == 0:
+        logging.error(f"No {name} data returned, keeping the last valid data intact")
+        return None
+    try:
+        with db_manager.publish_cycle() as session:
+            WRITE_FUNCTIONS[name](rows, session=session)
+    except SQLAlchemyError:
+        return None  # not marked as stored, the next fetch writes it again
+    mark_stored(name, payload_version(payload))
+    return payload
 
-    return data
+
+# to fetch  data
+def fetch_market_data(all_pages: bool = False, resume: bool = True):
+    if all_pages:
+        return fetch_all_market_pages(resume=resume)
+    return store_endpoint('market_data', fetch_endpoint('market_data'))
+
+
+def fetch_all_market_pages(resume: bool = True, dry_run: bool = False):
+    # walk every /coins/markets page and write each one as it arrives, only one page is held in memory;
+    # returns the number of coins stored, or None when the walk stopped early.
+    # pages are requested without validators: a 304 for a page says nothing about whether this walk stored it
+    url = f"{COINGECKO_API}/coins/markets"
+    timeout = ENDPOINTS['market_data'][2]
+    page = 1
+    if resume and not dry_run:
+        last_page = db_manager.get_checkpoint(MARKET_PAGES_CHECKPOINT)
+        if last_page:
+            page = last_page + 1
+            logging.info(f"Resuming market data ingestion from page {page}")
+    # coins seen during a walk that started at page 1, anything else is pruned at the end
+    seen_coin_ids = set() if page == 1 else None
+    # leaderboards keep only their top/bottom candidates between pages, published once the walk is complete
+    leaderboards = LeaderboardBuilder()
+
+    total = 0
+    while True:
+        params = {**MARKET_DATA_PARAMS, 'per_page': MARKET_PAGE_SIZE, 'page': page}
+        records = stream_records_from_api(url, params, timeout=timeout)
+        try:
+            if records is None:
+                raise ValueError("no page data returned")
+            # coins are parsed off the socket straight into the columnar normalisation step
+            frame = normalise_market_page(records)
+            if seen_coin_ids is not None:
+                seen_coin_ids.update(frame['coin_id'].dropna())
+                leaderboards.add(frame)
+            if dry_run:
+                count = len(frame)
+            else:
+                count = db_manager.append_market_data(frame, checkpoint=(MARKET_PAGES_CHECKPOINT, page))
+        except (SQLAlchemyError, requests.exceptions.RequestException, ValueError) as e:
+            # the checkpoint keeps the last completed page, the next run continues from there
+            logging.error(f"Market data ingestion stopped at page {page}, {total} coins stored this run: {e}")
+            return None
+        total += count
+        if count < MARKET_PAGE_SIZE:
+            break
+        page += 1
+
+    if not dry_run:
+        if seen_coin_ids:
+            try:
+                with db_manager.publish_cycle() as session:
+                    db_manager.prune_market_data(seen_coin_ids, session=session)
+                    db_manager.insert_leaderboards(leaderboards.boards(), session=session)
+            except SQLAlchemyError as e:
+                logging.error(f"Market data pruning and leaderboards were not published: {e}")
+        db_manager.clear_checkpoint(MARKET_PAGES_CHECKPOINT)
+    logging.info(f"Market data ingestion finished: {page} pages, {total} coins stored this run")
+    return total
+
+
+def process_market_data(data):
+    # one vectorised pass over the page instead of a dict and three date parses per coin
+    return normalise_market_page(data) if data else None
 
 
 def fetch_global_data():
-    url = f"{COINGECKO_API}/global"
-    response_data = fetch_data_from_api(url)
+    return store_endpoint('global_data', fetch_endpoint('global_data'))
 
-    if 'data' in response_data:
+
+def process_global_data(response_data):
+    if response_data and 'data' in response_data:
         global_data = response_data['data']
         processed_data = {
             "active_cryptocurrencies": global_data.get("active_cryptocurrencies"),
@@ -140,19 +263,18 @@ def fetch_global_data():
             "updated_at": parse_datetime(global_data.get("updated_at")),
             "timestamp": datetime.utcnow()
         }
-
-        # Insert processed data into the database
-        db_manager.insert_global_data(processed_data)
-    else:
-        print("Error: 'data' field not found in response from /global endpoint")
+        return processed_data
+    print("Error: 'data' field not found in response from /global endpoint")
+    return None
 
 
 def fetch_trending_data():
-    url = f"{COINGECKO_API}/search/trending"
-    data = fetch_data_from_api(url)
+    return store_endpoint('trending_data', fetch_endpoint('trending_data'))
+
 
+def process_trending_data(data):
+    trending_coins = []
     if data and "coins" in data:
-        trending_coins = []
         for coin in data["coins"]:
             item = coin.get("item", {})
 
@@ -180,16 +302,17 @@ def fetch_trending_data():
             }
             trending_coins.append(coin_data)
 
-        db_manager.insert_trending_coins(trending_coins)
-
     return trending_coins
 
 
 def fetch_market_dominance():
-    url = f"{COINGECKO_API}/global"
-    response = requests.get(url)
-    if response.status_code == 200:
-        data = response.json().get('data', {})
+    # shares the /global download with fetch_global_data through api_client's single-flight layer
+    return store_endpoint('market_dominance', fetch_endpoint('market_dominance'))
+
+
+def process_market_dominance(response_data):
+    if response_data:
+        data = response_data.get('data', {})
         market_cap_percentage = data.get('market_cap_percentage', {})
 
         market_dominance_data = {
@@ -211,32 +334,64 @@ def fetch_market_dominance():
             ),
             'timestamp': datetime.utcnow()
         }
+        return market_dominance_data
+    return None
+
 
-        # Insert data into the database
-        db_manager.insert_market_dominance(market_dominance_data)
+def fetch_category_data(dry_run: bool = False, session=None):
+    path, params, timeout = ENDPOINTS['category_data']
+    fetched = {}
+    records = stream_records_from_api(f"{COINGECKO_API}{path}", params, timeout=timeout,
+                                      validators=stored_versions.get('category_data'),
+                                      on_complete=lambda validators: fetched.update(validators=validators))
+    if records is UNCHANGED:
+        logging.info("category_data not modified upstream, keeping stored data")
+        return UNCHANGED
+    if records is None:
+        return None
+    if dry_run:
+        return sum(1 for _ in map(process_category, records))
+    count = store_category_stream(records, session=session)
+    if count is not None and session is None:
+        mark_stored('category_data', fetched.get('validators'))
+    return count
+
+
+def process_category(category):
+    return {
+        "category_id": category.get("id"),  # Maps to 'category_id' in Categories
+        "name": category.get("name"),
+        "market_cap": category.get("market_cap"),
+        "market_cap_24h_change": category.get("market_cap_change_24h"),  # Corrected to match the field name
+        "top_3_coins": json.dumps(category.get("top_3_coins", [])),  # Serialize as JSON
+        "volume_24h": category.get("volume_24h"),
+        "timestamp": datetime.utcnow()  # Manually add timestamp
+    }
 
 
-def fetch_category_data():
-    url = f"{COINGECKO_API}/coins/categories"
-    data = fetch_data_from_api(url)
+def process_category_data(data):
+    return [process_category(category) for category in data] if data else []
 
-    if data:
-        processed_data = []
-        for category in data:
-            category_data = {
-                "category_id": category.get("id"),  # Maps to 'category_id' in Categories
-                "name": category.get("name"),
-                "market_cap": category.get("market_cap"),
-                "market_cap_24h_change": category.get("market_cap_change_24h"),  # Corrected to match the field name
-                "top_3_coins": json.dumps(category.get("top_3_coins", [])),  # Serialize as JSON
-                "volume_24h": category.get("volume_24h"),
-                "timestamp": datetime.utcnow()  # Manually add timestamp
-            }
-            processed_data.append(category_data)
 
-        db_manager.insert_category_data(processed_data)
+def store_category_stream(records, session=None):
+    # each category is normalised as soon as it is parsed and flushed to the database in batches
+    batches = batched((process_category(category) for category in records), CATEGORY_BATCH_SIZE)
+    try:
+        return db_manager.insert_category_batches(batches, session=session)
+    except (requests.exceptions.RequestException, ValueError, SQLAlchemyError) as e:
+        logging.error(f"Streaming category data failed, keeping the last valid data intact: {e}")
+        return None
 
-    return data
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 def fetch_coin_symbols():
     url = f"{COINGECKO_API}/coins/id"
@@ -266,31 +421,24 @@ def fetch_coin_symbols():
     return data
 
 
-# def main():
-#     print("START")
-# initialize the database
-db_manager.initialize_db()
-
-
-# Fetch market data and store it in the database
-# print("Fetching market data...")
-market_data = fetch_market_data()
-
-# Fetch and store global crypto data
-global_data = fetch_global_data()
-
-# Fetch and store trending data
-trending_data = fetch_trending_data()
-
-market_dominance = fetch_market_dominance()
-# print("market_dominance Data:", market_dominance)
-
-# Fetch and store all coin categories
-# print("Fetching coin categories...")
-category_data = fetch_category_data()
-
-top_projects_by_volume = db_manager.insert_top_projects_by_volume()
-top_gainers_market_cap = db_manager.insert_top_gainers_market_cap()
-#
-# if __name__ == "__main__":
-#     main()
+# normalisation step of each dataset, used by data.ingest to process and write separately
+PROCESS_FUNCTIONS = {
+    'market_data': process_market_data,
+    'global_data': process_global_data,
+    'trending_data': process_trending_data,
+    'market_dominance': process_market_dominance,
+    'category_data': process_category_data,
+}
+
+WRITE_FUNCTIONS = {
+    'market_data': db_manager.insert_market_data,
+    'global_data': db_manager.insert_global_data,
+    'trending_data': db_manager.insert_trending_coins,
+    'market_dominance': db_manager.insert_market_dominance,
+    'category_data': db_manager.insert_category_data,
+}
+
+# datasets that are parsed and written record by record while they download
+STREAM_FUNCTIONS = {
+    'category_data': fetch_category_data,
+}
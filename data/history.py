@@ -0,0 +1,140 @@
+import os
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import select, text
+from data import db_manager, rollups
+from data.read_layer import read_frame
+
+
+# whole partitions older than this are dropped, set HISTORY_RETENTION_DAYS=0 to keep everything
+RETENTION_DAYS = int(os.getenv('HISTORY_RETENTION_DAYS', 90))
+# partitions are created ahead of time so ingestion never runs DDL on a partitioned parent
+PARTITIONS_AHEAD = 2
+
+
+def partition_name(table_name, day):
+    return f"{table_name}_p{day:%Y%m%d}"
+
+
+def is_partitioned(connection):
+    return connection.dialect.name == 'postgresql'
+
+
+def ensure_partitions(days_ahead=PARTITIONS_AHEAD, start=None):
+    # one partition per day from today (or start) to days_ahead, plus a default catch-all.
+    # runs before every refresh cycle; rows that already landed in the default partition (a day nobody created
+    # in time) get their own partitions and are moved there, PostgreSQL refuses the partition otherwise
+    if not is_partitioned(db_manager.engine):
+        return
+    first_day = (start or datetime.utcnow()).date()
+    wanted = {first_day + timedelta(days=offset)
+              for offset in range((datetime.utcnow().date() - first_day).days + days_ahead + 1)}
+    with db_manager.engine.begin() as connection:
+        for table in db_manager.HISTORY_TABLES.values():
+            default = f"{table.name}_default"
+            existing = set(list_partitions(connection, table.name).values())
+            has_default = connection.execute(text("SELECT to_regclass(:name)"), {'name': default}).scalar()
+            stranded = set()
+            if has_default:
+                stranded = {row[0] for row in connection.execute(
+                    text(f'SELECT DISTINCT CAST("timestamp" AS date) FROM {default}'))}
+            missing = sorted((wanted | stranded) - existing)
+            if stranded:
+                connection.execute(text(f"ALTER TABLE {table.name} DETACH PARTITION {default}"))
+            for day in missing:
+                connection.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {partition_name(table.name, day)} PARTITION OF {table.name} "
+                    f"FOR VALUES FROM ('{day}') TO ('{day + timedelta(days=1)}')"
+                ))
+            if stranded:
+                # every stranded day has a partition now, route the rows through the parent and reattach
+                moved = connection.execute(text(f"INSERT INTO {table.name} SELECT * FROM {default}")).rowcount
+                connection.execute(text(f"DELETE FROM {default}"))
+                connection.execute(text(f"ALTER TABLE {table.name} ATTACH PARTITION {default} DEFAULT"))
+                logging.warning(f"Moved {moved} {table.name} rows out of the default partition into "
+                                f"{', '.join(str(day) for day in sorted(stranded))}")
+            elif not has_default:
+                connection.execute(text(f"CREATE TABLE {default} PARTITION OF {table.name} DEFAULT"))
+
+
+def list_partitions(connection, table_name):
+    rows = connection.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+        "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+        "WHERE parent.relname = :parent"
+    ), {'parent': table_name})
+    partitions = {}
+    for (name,) in rows:
+        try:
+            partitions[name] = datetime.strptime(name.rsplit('_p', 1)[1], '%Y%m%d').date()
+        except (IndexError, ValueError):
+            continue  # the default partition
+    return partitions
+
+
+def apply_retention(retention_days=RETENTION_DAYS):
+    # drop whole day partitions past the retention window instead of deleting rows
+    if not retention_days:
+        return 0
+    cutoff = (datetime.utcnow() - timedelta(days=retention_days)).date()
+    dropped = 0
+    with db_manager.engine.begin() as connection:
+        for table in db_manager.HISTORY_TABLES.values():
+            if is_partitioned(connection):
+                for name, day in list_partitions(connection, table.name).items():
+                    if day < cutoff:
+                        connection.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                        dropped += 1
+            else:
+                # no declarative partitioning outside PostgreSQL, fall back to a range delete
+                result = connection.execute(table.delete().where(table.c.timestamp < cutoff))
+                dropped += result.rowcount or 0
+    if dropped:
+        logging.info(f"History retention removed {dropped} partitions/rows older than {cutoff}")
+    return dropped
+
+
+def query_history(dataset, start, end=None, columns=None, **filters):
+    # the timestamp range lets PostgreSQL prune every partition outside [start, end)
+    table = db_manager.HISTORY_TABLES[dataset]
+    selected = [table.c[name] for name in columns] if columns else [table]
+    query = select(*selected).where(table.c.timestamp >= start)
+    if end is not None:
+        query = query.where(table.c.timestamp < end)
+    for name, value in filters.items():
+        query = query.where(table.c[name] == value)
+    with db_manager.engine.connect() as connection:
+        return [dict(row._mapping) for row in connection.execute(query.order_by(table.c.timestamp))]
+
+
+def query_market_series(coin_id, start, end=None, resolution=None):
+    # OHLC frame for one coin, read from the coarsest table that still gives a detailed chart for the range
+    resolution = resolution or rollups.choose_resolution(start, end)
+    if resolution == 'raw':
+        table = db_manager.HISTORY_TABLES['market_data']
+        query = select(
+            table.c.timestamp.label('bucket_start'),
+            *[table.c[field].label(f"{prefix}_{part}") for field, prefix in rollups.OHLC_FIELDS.items()
+              for part in ('open', 'high', 'low', 'close')],
+            table.c[rollups.VOLUME_FIELD].label('volume'),
+        ).where(table.c.coin_id == coin_id, table.c.timestamp >= start)
+        if end is not None:
+            query = query.where(table.c.timestamp < end)
+        query = query.order_by(table.c.timestamp)
+    else:
+        table = db_manager.MarketDataRollup.__table__
+        query = select(
+            table.c.bucket_start,
+            *[table.c[f"{prefix}_{part}"] for prefix in rollups.OHLC_FIELDS.values()
+              for part in ('open', 'high', 'low', 'close')],
+            table.c.volume,
+        ).where(table.c.resolution == resolution, table.c.coin_id == coin_id,
+                table.c.bucket_start >= rollups.bucket_start(start, resolution))
+        if end is not None:
+            query = query.where(table.c.bucket_start < end)
+        query = query.order_by(table.c.bucket_start)
+    with db_manager.read_engine.connect() as connection:
+        frame = read_frame(connection, query)
+    frame.attrs['resolution'] = resolution
+    return frame
@@ -0,0 +1,63 @@
+import argparse
+import logging
+import time
+from data import db_manager, fetch_data, api_client, history, schema, refresh_dag
+
+
+# Explicit entry point for a refresh cycle, importing data.* modules no longer touches the network or the DB.
+#   python -m data.ingest                               refresh every dataset
+#   python -m data.ingest --only market_data,global_data
+#   python -m data.ingest --all-pages --dry-run         walk the full market universe without writing
+
+
+def run_refresh(datasets=None, dry_run=False, all_pages=False, resume=True):
+    names = list(datasets or fetch_data.ENDPOINTS)
+    unknown = [name for name in names if name not in fetch_data.ENDPOINTS]
+    if unknown:
+        raise ValueError(f"Unknown datasets: {', '.join(unknown)}")
+    if not dry_run:
+        db_manager.initialize_db()
+        history.ensure_partitions()
+        schema.report_query_plans()
+
+    start = time.perf_counter()
+    summary = {}
+    if all_pages and 'market_data' in names:
+        names.remove('market_data')
+        rows = fetch_data.fetch_all_market_pages(resume=resume, dry_run=dry_run)
+        if rows is None:
+            # stopped early, the checkpoint lets the next run resume
+            summary['market_data'] = {'status': 'failed', 'rows': 0}
+        else:
+            summary['market_data'] = {'status': 'dry-run' if dry_run else 'written', 'rows': rows}
+
+    # fetch and normalise run in parallel, the writes publish one generation and the derive nodes run after it
+    results = refresh_dag.run_refresh_dag(names, dry_run=dry_run)
+    summary.update(refresh_dag.dataset_summary(results, names, dry_run=dry_run))
+
+    logging.info(f"Response cache: {api_client.response_cache_stats()}")
+    logging.info(f"Rate limiter: {api_client.rate_limit_stats()}")
+    logging.info(f"Refresh cycle finished in {time.perf_counter() - start:.2f}s")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch CoinGecko data and store it in the dashboard database")
+    parser.add_argument('--only', help=f"comma separated datasets ({', '.join(fetch_data.ENDPOINTS)})")
+    parser.add_argument('--dry-run', action='store_true', help="fetch and normalise, but write nothing")
+    parser.add_argument('--all-pages', action='store_true', help="walk every /coins/markets page")
+    parser.add_argument('--no-resume', action='store_true', help="restart paginated ingestion from page 1")
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="%(asctime)s %(levelname)s %(message)s")
+    datasets = [name.strip() for name in args.only.split(',')] if args.only else None
+    summary = run_refresh(datasets, dry_run=args.dry_run, all_pages=args.all_pages, resume=not args.no_resume)
+    for name, result in summary.items():
+        print(f"{name:<18} {result['status']:<10} {result['rows']} rows")
+    return 0 if all(result['status'] != 'failed' for result in summary.values()) else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,82 @@
+import codecs
+import json
+
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+_NUMBER_START = '-0123456789'
+_NUMBER_CHARS = '0123456789.eE+-'
+
+
+def _skip(buffer, pos, chars):
+    while pos < len(buffer) and buffer[pos] in chars:
+        pos += 1
+    return pos
+
+
+def iter_json_array(chunks, encoding='utf-8'):
+    # yield the elements of a top-level JSON array one at a time from an iterable of byte chunks,
+    # so a large payload is never materialised as one list
+    text_decoder = codecs.getincrementaldecoder(encoding)()
+    chunks = iter(chunks)
+    buffer = ''
+    pos = 0
+    exhausted = False
+    # what may come next: '[' to open the array, an element (or ']' right after '['), or ',' / ']' after an element
+    expect = 'open'
+
+    def read_more():
+        nonlocal buffer, pos, exhausted
+        chunk = next(chunks, None)
+        if chunk is None:
+            buffer = buffer[pos:] + text_decoder.decode(b'', final=True)
+            exhausted = True
+        else:
+            buffer = buffer[pos:] + text_decoder.decode(chunk)
+        pos = 0
+
+    while True:
+        pos = _skip(buffer, pos, _WHITESPACE)
+        if pos >= len(buffer):
+            if exhausted:
+                raise ValueError("Unexpected end of JSON stream")
+            read_more()
+            continue
+        char = buffer[pos]
+
+        if expect == 'open':
+            if char != '[':
+                raise ValueError(f"Expected a JSON array, got {char!r}")
+            expect = 'first'
+            pos += 1
+            continue
+
+        if expect == 'separator':
+            if char == ']':
+                return
+            if char != ',':
+                raise ValueError(f"Expected ',' or ']' between array elements, got {char!r}")
+            expect = 'item'
+            pos += 1
+            continue
+
+        if char == ']' and expect == 'first':
+            return
+        if char in ',]':
+            raise ValueError(f"Expected an array element, got {char!r}")
+
+        try:
+            item, end = _decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if exhausted:
+                raise
+            read_more()
+            continue
+        # a scalar at the very end of the buffer may be cut short (e.g. 12|34), wait for more input; a number is
+        # only complete once the next character can no longer continue it (e.g. 0|.1 or 1|e5)
+        if not exhausted and (end >= len(buffer) or (char in _NUMBER_START and buffer[end] in _NUMBER_CHARS)):
+            read_more()
+            continue
+        pos = end
+        expect = 'separator'
+        yield item
@@ -0,0 +1,59 @@
+import pandas as pd
+
+
+TOP_N = 20
+
+# ranked column -> (window, directions), every board is computed from the market batch already in memory
+LEADERBOARD_METRICS = {
+    'price_change_percentage_1h': ('1h', ('top', 'bottom')),
+    'price_change_percentage_24h': ('24h', ('top', 'bottom')),
+    'market_cap_change_percentage_24h': ('24h', ('top', 'bottom')),
+    'price_change_percentage_7d': ('7d', ('top', 'bottom')),
+    'total_volume': ('24h', ('top',)),
+}
+# window -> metric the top_gainers_market_cap table is ranked by
+GAINER_METRICS = {
+    '1h': 'price_change_percentage_1h',
+    '24h': 'market_cap_change_percentage_24h',
+    '7d': 'price_change_percentage_7d',
+}
+VOLUME_METRIC = 'total_volume'
+
+
+def select_rows(frame: pd.DataFrame, metric, direction, n=TOP_N) -> pd.DataFrame:
+    # nlargest/nsmallest partially select the n rows instead of sorting the whole batch, NaN is skipped
+    if direction == 'top':
+        return frame.nlargest(n, metric)
+    return frame.nsmallest(n, metric)
+
+
+class LeaderboardBuilder:
+    # keeps only the rows that can still make a board, so paginated ingestion can add one page at a time
+    def __init__(self, n=TOP_N):
+        self.n = n
+        self.candidates = {}
+
+    def add(self, frame: pd.DataFrame):
+        for metric, (window, directions) in LEADERBOARD_METRICS.items():
+            if metric not in frame.columns:
+                continue
+            values = pd.to_numeric(frame[metric], errors='coerce')
+            rows = frame.assign(**{metric: values})
+            for direction in directions:
+                rows_for_board = select_rows(rows, metric, direction, self.n)
+                current = self.candidates.get((metric, direction))
+                if current is not None:
+                    # a coin can show up on two pages when ranks shift mid-walk, keep its latest row
+                    rows_for_board = pd.concat([current, rows_for_board])
+                    if 'coin_id' in rows_for_board.columns:
+                        rows_for_board = rows_for_board.drop_duplicates('coin_id', keep='last')
+                    rows_for_board = select_rows(rows_for_board, metric, direction, self.n)
+                self.candidates[(metric, direction)] = rows_for_board
+        return self
+
+    def boards(self):
+        # (metric, direction) -> frame ordered by rank, rank starts at 1
+        boards = {}
+        for (metric, direction), frame in self.candidates.items():
+            boards[(metric, direction)] = frame.assign(rank=range(1, len(frame) + 1))
+        return boards
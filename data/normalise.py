@@ -0,0 +1,57 @@
+from datetime import datetime
+import pandas as pd
+
+
+# /coins/markets fields stored in MarketData, in table order
+MARKET_COLUMNS = [
+    "coin_id", "symbol", "name", "image", "current_price", "market_cap", "market_cap_rank",
+    "fully_diluted_valuation", "total_volume", "high_24h", "low_24h", "price_change_24h", "price_change_percentage_24h",
+    "market_cap_change_24h", "market_cap_change_percentage_24h", "circulating_supply", "total_supply",
+    "max_supply", "ath", "ath_change_percentage", "ath_date", "atl", "atl_change_percentage", "atl_date",
+    "roi", "last_updated", "price_change_percentage_1h", "price_change_percentage_7d", "sparkline_in_7d",
+]
+MARKET_DATETIME_COLUMNS = ["ath_date", "atl_date", "last_updated"]
+MARKET_FLOAT_COLUMNS = [
+    "current_price", "market_cap", "fully_diluted_valuation", "total_volume", "high_24h", "low_24h",
+    "price_change_24h", "price_change_percentage_24h", "market_cap_change_24h", "market_cap_change_percentage_24h",
+    "circulating_supply", "total_supply", "max_supply", "ath", "ath_change_percentage", "atl",
+    "atl_change_percentage", "price_change_percentage_1h", "price_change_percentage_7d",
+]
+# api field -> column (the *_in_currency fields appear when the request asks for price_change_percentage)
+MARKET_RENAMES = {
+    "id": "coin_id",
+    "price_change_percentage_1h_in_currency": "price_change_percentage_1h",
+    "price_change_percentage_7d_in_currency": "price_change_percentage_7d",
+}
+
+
+def parse_datetime_column(values: pd.Series) -> pd.Series:
+    # vectorised ISO-8601 parse, returns naive UTC timestamps like datetime.utcnow()
+    parsed = pd.to_datetime(values, utc=True, errors='coerce')
+    return parsed.dt.tz_localize(None)
+
+
+def normalise_market_page(coins, timestamp=None) -> pd.DataFrame:
+    # turn one page of /coins/markets records into a typed frame in a single pass
+    frame = pd.DataFrame.from_records(coins)
+    for source, column in MARKET_RENAMES.items():
+        if source in frame.columns:
+            frame[column] = frame[source] if column not in frame.columns else frame[column].fillna(frame[source])
+    frame = frame.reindex(columns=MARKET_COLUMNS)
+
+    frame[MARKET_FLOAT_COLUMNS] = frame[MARKET_FLOAT_COLUMNS].apply(pd.to_numeric, errors='coerce')
+    frame["market_cap_rank"] = pd.to_numeric(frame["market_cap_rank"], errors='coerce').astype("Int64")
+    for column in MARKET_DATETIME_COLUMNS:
+        frame[column] = parse_datetime_column(frame[column])
+    frame["timestamp"] = timestamp or datetime.utcnow()
+    return frame
+
+
+def frame_columns(frame: pd.DataFrame):
+    # column lists for the DB driver: missing values (NaN, NaT, <NA>) become None
+    return [frame[name].astype(object).where(frame[name].notna(), None).tolist() for name in frame.columns]
+
+
+def frame_records(frame: pd.DataFrame):
+    names = list(frame.columns)
+    return [dict(zip(names, row)) for row in zip(*frame_columns(frame))]
@@ -0,0 +1,134 @@
+import functools
+import os
+import threading
+from collections import OrderedDict
+from data import db_manager, read_layer, shared_cache
+
+
+# Query result cache for dashboard reads. Entries are keyed by statement and data generation: the data only
+# changes when a refresh cycle publishes a new generation, and everything older is dropped the moment it lands.
+
+MAX_BYTES = int(float(os.getenv('QUERY_CACHE_MAX_MB', 256)) * 1024 * 1024)
+# with CACHE_BACKEND=shared the frames are kept once in the cross-process store instead of in every worker,
+# the generation is part of the key there and older generations age out
+SHARED_TTL = 24 * 3600
+shared = shared_cache.SharedCache('query_results', ttl=SHARED_TTL) if shared_cache.ENABLED else None
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # statement key -> (frame, bytes), least recently used first
+_generation = None
+query_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0, "bytes": 0, "layout_builds": 0}
+
+
+def statement_key(statement):
+    compiled = statement.compile(dialect=db_manager.read_engine.dialect)
+    return str(compiled), tuple(sorted((name, repr(value)) for name, value in compiled.params.items()))
+
+
+def frame_bytes(frame):
+    return int(frame.memory_usage(deep=True).sum())
+
+
+def _set_generation(generation):
+    # caller holds _lock, returns False for a generation older than the cached one (a slower reader thread)
+    global _generation
+    if _generation is not None and generation < _generation:
+        return False
+    if generation != _generation:
+        if _entries:
+            query_cache_stats["invalidations"] += 1
+        _entries.clear()
+        query_cache_stats["bytes"] = 0
+        _generation = generation
+    return True
+
+
+def _put(key, frame):
+    size = frame_bytes(frame)
+    if size > MAX_BYTES:
+        return
+    if key in _entries:
+        query_cache_stats["bytes"] -= _entries.pop(key)[1]
+    _entries[key] = (frame, size)
+    query_cache_stats["bytes"] += size
+    while query_cache_stats["bytes"] > MAX_BYTES:
+        _, (_, evicted) = _entries.popitem(last=False)
+        query_cache_stats["bytes"] -= evicted
+        query_cache_stats["evictions"] += 1
+
+
+def cached_frames(statements) -> dict:
+    # name -> select, answered from the cache when the generation has not moved since the frames were read
+    keys = {name: statement_key(statement) for name, statement in statements.items()}
+    generation = db_manager.current_generation()
+    found = {}
+    with _lock:
+        current = _set_generation(generation)
+        for name, key in keys.items():
+            if current and shared is not None:
+                frame = shared.get((generation, key))
+                if frame is not None:
+                    found[name] = frame
+            elif current and key in _entries:
+                _entries.move_to_end(key)
+                found[name] = _entries[key][0]
+        query_cache_stats["hits"] += len(found)
+        query_cache_stats["misses"] += len(keys) - len(found)
+
+    missing = {name: statement for name, statement in statements.items() if name not in found}
+    if missing:
+        snapshot_generation, frames = read_layer.read_snapshot(missing)
+        if snapshot_generation != generation:
+            # a cycle was published in between, the cached frames are from the previous one: read them all again
+            snapshot_generation, frames = read_layer.read_snapshot(statements)
+            found = {}
+        with _lock:
+            if _set_generation(snapshot_generation):
+                for name, frame in frames.items():
+                    if shared is not None:
+                        shared.set((snapshot_generation, keys[name]), frame)
+                    else:
+                        _put(keys[name], frame)
+        found.update(frames)
+    # shallow copies, so adding columns on the dashboard side never touches the cached frames
+    return {name: found[name].copy(deep=False) for name in statements}
+
+
+def per_generation(build):
+    # memoises a zero-argument builder (e.g. a page layout) until the next generation is published,
+    # one caller rebuilds while the others wait for its result
+    lock = threading.Lock()
+    memo = {}
+
+    @functools.wraps(build)
+    def wrapper():
+        generation = db_manager.current_generation()
+        with lock:
+            if memo.get('generation') != generation:
+                memo['value'] = build()
+                memo['generation'] = generation
+                with _lock:
+                    query_cache_stats["layout_builds"] += 1
+            return memo['value']
+    return wrapper
+
+
+def clear():
+    global _generation
+    with _lock:
+        _entries.clear()
+        query_cache_stats["bytes"] = 0
+        _generation = None
+
+
+def cache_stats():
+    with _lock:
+        lookups = query_cache_stats["hits"] + query_cache_stats["misses"]
+        return {
+            **query_cache_stats,
+            "generation": _generation,
+            "entries": len(_entries),
+            "max_bytes": MAX_BYTES,
+            "hit_ratio": round(query_cache_stats["hits"] / lookups, 3) if lookups else 0.0,
+            "shared": shared.stats() if shared is not None else None,
+        }
@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+import logging
+
+
+# CoinGecko free tier budget, override with env vars for a paid plan
+CALLS_PER_MINUTE = float(os.getenv('COINGECKO_CALLS_PER_MINUTE', 10))
+BURST = int(os.getenv('COINGECKO_BURST', 3))
+
+
+class TokenBucket:
+    def __init__(self, calls_per_minute: float, capacity: int):
+        self.rate = calls_per_minute / 60.0  # tokens per second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+        # stats
+        self.calls = 0
+        self.waited_calls = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _refill(self, now):
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+    def acquire(self, tokens: int = 1) -> float:
+        # block until a token is available, return how long the caller waited
+        start = time.monotonic()
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= tokens:
+                    self.tokens -= tokens
+                    waited = now - start
+                    self.calls += 1
+                    self.total_wait += waited
+                    self.max_wait = max(self.max_wait, waited)
+                    if waited > 0.001:
+                        self.waited_calls += 1
+                    return waited
+                sleep_for = max(self.paused_until - now, (tokens - self.tokens) / self.rate)
+            time.sleep(max(sleep_for, 0.01))
+
+    def pause(self, seconds: float):
+        # called after a 429: empty the bucket and hold every caller back
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = 0.0
+            self.updated_at = now
+            self.paused_until = max(self.paused_until, now + seconds)
+        logging.warning(f"Rate limit hit. Pausing API calls for {seconds:.0f} seconds")
+
+    def remaining(self) -> float:
+        with self.lock:
+            self._refill(time.monotonic())
+            return self.tokens
+
+    def stats(self):
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                "calls": self.calls,
+                "waited_calls": self.waited_calls,
+                "total_wait_seconds": round(self.total_wait, 3),
+                "max_wait_seconds": round(self.max_wait, 3),
+                "avg_wait_seconds": round(self.total_wait / self.calls, 3) if self.calls else 0.0,
+                "remaining_tokens": round(self.tokens, 2),
+                "capacity": self.capacity,
+                "calls_per_minute": self.rate * 60,
+                "paused_for_seconds": round(max(self.paused_until - now, 0.0), 1),
+            }
+
+
+# shared by every thread in the process
+limiter = TokenBucket(CALLS_PER_MINUTE, BURST)
@@ -0,0 +1,88 @@
+import json
+import logging
+import os
+import pandas as pd
+from sqlalchemy import JSON, select, func
+from data import db_manager
+
+try:  # optional: Arrow-native PostgreSQL reads
+    import adbc_driver_postgresql.dbapi as adbc_postgresql
+except ImportError:
+    adbc_postgresql = None
+
+
+# Dashboard read path: Core selects of only the needed columns, turned into DataFrames column by column
+# instead of hydrating ORM objects and copying every attribute into a dict.
+
+# rows fetched per round trip, large results stream through a server-side cursor on PostgreSQL
+FETCH_BATCH_SIZE = int(os.getenv('DB_FETCH_BATCH_SIZE', 5000))
+# opt in with DB_READ_ARROW=1: the ADBC path opens its own connection per read, outside the read pool
+USE_ARROW = os.getenv('DB_READ_ARROW', '0').lower() in ('1', 'true', 'yes')
+
+
+def json_columns(statement):
+    return [column.name for column in statement.selected_columns if isinstance(column.type, JSON)]
+
+
+def result_frame(result, batch_size=FETCH_BATCH_SIZE) -> pd.DataFrame:
+    names = list(result.keys())
+    columns = [[] for _ in names]
+    for rows in result.partitions(batch_size):
+        for values, column in zip(zip(*rows), columns):
+            column.extend(values)
+    return pd.DataFrame(dict(zip(names, columns)), columns=names)
+
+
+def read_frame(connection, statement, batch_size=FETCH_BATCH_SIZE) -> pd.DataFrame:
+    # stream_results makes psycopg use a named (server-side) cursor, SQLite ignores it
+    result = connection.execution_options(stream_results=True, max_row_buffer=batch_size).execute(statement)
+    try:
+        return result_frame(result, batch_size)
+    finally:
+        result.close()
+
+
+def arrow_enabled(engine):
+    return USE_ARROW and adbc_postgresql is not None and engine.dialect.name == 'postgresql'
+
+
+def arrow_uri(engine):
+    # ADBC takes a plain libpq URI, without the SQLAlchemy driver suffix
+    return engine.url.set(drivername='postgresql').render_as_string(hide_password=False)
+
+
+def read_arrow_frame(connection, statement) -> pd.DataFrame:
+    sql = str(statement.compile(dialect=db_manager.read_engine.dialect, compile_kwargs={'literal_binds': True}))
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+        frame = cursor.fetch_arrow_table().to_pandas()
+    # Arrow hands JSON columns back as text
+    for name in json_columns(statement):
+        frame[name] = frame[name].map(json.loads, na_action='ignore')
+    return frame
+
+
+def generation_query():
+    return select(func.coalesce(func.max(db_manager.DataGeneration.id), 0))
+
+
+def read_snapshot(statements):
+    # (generation, name -> frame): every select and the generation number come from one REPEATABLE READ
+    # transaction, so a refresh cycle committing mid-read can never produce a mix of two generations
+    engine = db_manager.read_engine
+    if arrow_enabled(engine):
+        try:
+            with adbc_postgresql.connect(arrow_uri(engine)) as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+                generation = int(read_arrow_frame(connection, generation_query()).iloc[0, 0])
+                return generation, {name: read_arrow_frame(connection, statement)
+                                    for name, statement in statements.items()}
+        except Exception as e:
+            logging.warning(f"Arrow read failed, falling back to the cursor path: {e}")
+    options = {'isolation_level': 'REPEATABLE READ'} if engine.dialect.name == 'postgresql' else {}
+    with engine.connect().execution_options(**options) as connection:
+        # on SQLite (local runs only) pysqlite does not open a transaction for plain selects
+        with connection.begin():
+            generation = connection.execute(generation_query()).scalar()
+            return generation, {name: read_frame(connection, statement) for name, statement in statements.items()}
@@ -0,0 +1,224 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import ExitStack
+from data import db_manager, fetch_data, history
+
+
+# A refresh cycle as a dependency graph: fetch -> normalise -> write -> commit -> derive.
+# Independent datasets fetch and normalise in parallel, writes share one publish-cycle session one at a time,
+# and derived work only starts once the cycle has committed. A failed node only stops the nodes that need it.
+
+WORKERS = 6
+
+OK = 'ok'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+UNCHANGED = 'unchanged'
+
+NodeResult = namedtuple('NodeResult', ['status', 'seconds', 'value', 'error'])
+
+
+class Node:
+    def __init__(self, name, func, deps=(), always=False, serial=False):
+        # func(inputs) gets {dep name: value}, always=True runs once the deps finished whatever their status,
+        # serial nodes never run at the same time as each other
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.always = always
+        self.serial = serial
+
+
+class RefreshDAG:
+    def __init__(self, workers=WORKERS):
+        self.workers = workers
+        self.nodes = {}
+        self.results = {}
+        self.serial_lock = threading.Lock()
+
+    def add(self, name, func, deps=(), always=False, serial=False):
+        missing = [dep for dep in deps if dep not in self.nodes]
+        if missing:
+            raise ValueError(f"{name} depends on unknown nodes: {', '.join(missing)}")
+        self.nodes[name] = Node(name, func, deps, always, serial)
+        return name
+
+    def _execute(self, node, inputs):
+        start = time.perf_counter()
+        try:
+            if node.serial:
+                with self.serial_lock:
+                    value = node.func(inputs)
+            else:
+                value = node.func(inputs)
+        except Exception as e:
+            logging.error(f"Refresh node {node.name} failed: {e}")
+            return NodeResult(FAILED, time.perf_counter() - start, None, repr(e))
+        status = UNCHANGED if value is fetch_data.UNCHANGED else OK
+        return NodeResult(status, time.perf_counter() - start, value, None)
+
+    def _blocked_status(self, node):
+        # None when the node can run, otherwise the status it inherits from its inputs
+        statuses = [self.results[dep].status for dep in node.deps]
+        if node.always or all(status == OK for status in statuses):
+            return None
+        return UNCHANGED if all(status in (OK, UNCHANGED) for status in statuses) else SKIPPED
+
+    def run(self):
+        pending = dict(self.nodes)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='refresh') as executor:
+            while pending or running:
+                for name, node in list(pending.items()):
+                    if any(dep not in self.results for dep in node.deps):
+                        continue
+                    del pending[name]
+                    blocked = self._blocked_status(node)
+                    if blocked is not None:
+                        self.results[name] = NodeResult(blocked, 0.0, None, None)
+                        continue
+                    inputs = {dep: self.results[dep].value for dep in node.deps}
+                    running[executor.submit(self._execute, node, inputs)] = name
+                if not running:
+                    if pending:
+                        # only reachable through nodes that resolved without running, go round again
+                        continue
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.results[running.pop(future)] = future.result()
+        return self.results
+
+    def report(self):
+        lines = []
+        for name in self.nodes:
+            result = self.results.get(name)
+            if result is None:
+                continue
+            error = f" ({result.error})" if result.error else ''
+            lines.append(f"{name:<28} {result.status:<10} {result.seconds * 1000:8.1f} ms{error}")
+        return '\n'.join(lines)
+
+
+def row_count(rows):
+    if rows is None or rows is fetch_data.UNCHANGED:
+        return 0
+    if isinstance(rows, int):
+        return rows
+    return 1 if isinstance(rows, dict) else len(rows)
+
+
+def build_refresh_dag(datasets=None, dry_run=False, workers=WORKERS):
+    # returns the graph and the ExitStack holding its publish cycle, the caller closes the stack after run()
+    names = list(fetch_data.ENDPOINTS if datasets is None else datasets)
+    dag = RefreshDAG(workers)
+    stack = ExitStack()
+    cycle = {}
+    versions = {}  # dataset -> version of what it wrote, marked as stored once the cycle committed
+    validators = {}  # streamed dataset -> validators of its download
+
+    if not dry_run:
+        # today's (and the next days') history partitions exist before anything is written; if this fails the
+        # writes still go ahead into the default partition and the next cycle moves those rows out
+        dag.add('prepare:partitions', lambda inputs: history.ensure_partitions())
+
+        def begin(inputs):
+            cycle['session'] = stack.enter_context(db_manager.publish_cycle())
+        dag.add('begin', begin, ['prepare:partitions'], always=True)
+
+    write_nodes = []
+    for name in names:
+        if name in fetch_data.STREAM_FUNCTIONS:
+            # streamed datasets open the download here; normalise parses it record by record into batches, off the
+            # serial write section, so the download overlaps the other branches instead of holding up their writes
+            def fetch(inputs, name=name):
+                path, params, timeout = fetch_data.ENDPOINTS[name]
+                records = fetch_data.stream_records_from_api(
+                    f"{fetch_data.COINGECKO_API}{path}", params, timeout,
+                    validators=fetch_data.stored_versions.get(name),
+                    on_complete=lambda received, name=name: validators.update({name: received}))
+                if records is None:
+                    raise ValueError(f"no {name} data returned")
+                return records
+
+            def normalise(inputs, name=name):
+                records = inputs[f'fetch:{name}']
+                categories = (fetch_data.process_category(category) for category in records)
+                if dry_run:
+                    return sum(1 for _ in categories)
+                return list(fetch_data.batched(categories, fetch_data.CATEGORY_BATCH_SIZE))
+
+            def write(inputs, name=name):
+                count = db_manager.insert_category_batches(inputs[f'normalise:{name}'], session=cycle['session'])
+                versions[name] = validators.get(name)
+                return count
+        else:
+            def fetch(inputs, name=name):
+                payload = fetch_data.fetch_endpoint(name)
+                if not payload:
+                    raise ValueError(f"no {name} data returned")
+                return payload
+
+            def normalise(inputs, name=name):
+                rows = fetch_data.PROCESS_FUNCTIONS[name](inputs[f'fetch:{name}'])
+                if rows is None or len(rows) == 0:
+                    raise ValueError(f"{name} payload could not be normalised")
+                return rows
+
+            def write(inputs, name=name):
+                rows = inputs[f'normalise:{name}']
+                fetch_data.WRITE_FUNCTIONS[name](rows, session=cycle['session'])
+                versions[name] = fetch_data.payload_version(inputs[f'fetch:{name}'])
+                return row_count(rows)
+
+        dag.add(f'fetch:{name}', fetch)
+        dag.add(f'normalise:{name}', normalise, [f'fetch:{name}'])
+        if not dry_run:
+            write_nodes.append(dag.add(f'write:{name}', write, ['begin', f'fetch:{name}', f'normalise:{name}'],
+                                       serial=True))
+
+    if dry_run:
+        return dag, stack
+
+    def commit(inputs):
+        # publishes every successful write as one generation, failed writes were rolled back to their savepoint
+        stack.close()
+        for name, version in versions.items():
+            fetch_data.mark_stored(name, version)
+        return db_manager.current_generation()
+    dag.add('commit', commit, ['begin', *write_nodes], always=True)
+
+    # derived work reads committed data only
+    dag.add('derive:history_retention', lambda inputs: history.apply_retention(), ['commit'])
+    return dag, stack
+
+
+def run_refresh_dag(datasets=None, dry_run=False, workers=WORKERS):
+    dag, stack = build_refresh_dag(datasets, dry_run=dry_run, workers=workers)
+    try:
+        results = dag.run()
+    finally:
+        # normally already closed by the commit node, rolls back if the run never got there
+        stack.close()
+    logging.info(f"Refresh DAG:\n{dag.report()}")
+    return results
+
+
+def dataset_summary(results, datasets=None, dry_run=False):
+    # per-dataset view of the node results, in the shape data.ingest reports
+    summary = {}
+    for name in fetch_data.ENDPOINTS if datasets is None else datasets:
+        last = f'normalise:{name}' if dry_run else f'write:{name}'
+        fetched, final = results.get(f'fetch:{name}'), results.get(last)
+        if fetched is None or final is None:
+            continue
+        if fetched.status == UNCHANGED:
+            summary[name] = {'status': 'unchanged', 'rows': 0}
+        elif final.status == OK:
+            summary[name] = {'status': 'dry-run' if dry_run else 'written', 'rows': row_count(final.value)}
+        else:
+            summary[name] = {'status': 'failed', 'rows': 0}
+    return summary
@@ -0,0 +1,249 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+
+
+# Local stand-in for the CoinGecko API.
+# Record:  COINGECKO_RECORD_DIR=fixtures python -m data.ingest   (or: python -m data.replay_server record)
+# Replay:  python -m data.replay_server serve --fixtures fixtures --coins 10000 --latency 0.2 --error-rate 0.05
+#          COINGECKO_API_URL=http://127.0.0.1:8765/api/v3 python -m data.ingest
+
+API_PREFIX = '/api/v3'
+RECORD_DIR = os.getenv('COINGECKO_RECORD_DIR')
+
+# endpoints captured by the record command, same requests the ingestion pipeline makes
+RECORD_ENDPOINTS = [
+    ('/coins/markets', {'vs_currency': 'usd', 'order': 'market_cap_desc', 'per_page': 250, 'page': 1,
+                        'price_change_percentage': '1h,24h,7d'}),
+    ('/global', None),
+    ('/search/trending', None),
+    ('/coins/categories', None),
+]
+
+_record_lock = threading.Lock()
+
+
+def endpoint_path(url):
+    path = urlsplit(url).path
+    return path[len(API_PREFIX):] if path.startswith(API_PREFIX) else path
+
+
+def fixture_name(path, params=None):
+    base = path.strip('/').replace('/', '_') or 'root'
+    items = sorted((str(k), str(v)) for k, v in (params or {}).items())
+    if not items:
+        return f"{base}.json"
+    digest = hashlib.sha1(json.dumps(items).encode()).hexdigest()[:10]
+    return f"{base}-{digest}.json"
+
+
+def record_response(url, params, body: bytes, record_dir=None):
+    # write one captured response body, plus an index entry so fixtures stay readable
+    record_dir = record_dir or RECORD_DIR
+    if not record_dir:
+        return
+    path = endpoint_path(url)
+    name = fixture_name(path, params)
+    with _record_lock:
+        os.makedirs(record_dir, exist_ok=True)
+        tmp_path = os.path.join(record_dir, f".{name}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(body)
+        os.replace(tmp_path, os.path.join(record_dir, name))
+
+        index_path = os.path.join(record_dir, 'index.json')
+        index = {}
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                index = json.load(f)
+        index[name] = {'path': path, 'params': {str(k): str(v) for k, v in (params or {}).items()},
+                       'recorded_at': time.time()}
+        with open(index_path, 'w') as f:
+            json.dump(index, f, indent=2, sort_keys=True)
+    logging.info(f"Recorded {path} -> {name}")
+
+
+class FixtureStore:
+    def __init__(self, fixture_dir, coins=None, categories=None):
+        self.fixture_dir = fixture_dir
+        self.coins = coins
+        self.categories = categories
+        self.payloads = {}
+        self.by_path = {}
+        index_path = os.path.join(fixture_dir, 'index.json')
+        index = {}
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                index = json.load(f)
+        for name in sorted(os.listdir(fixture_dir)):
+            if not name.endswith('.json') or name == 'index.json':
+                continue
+            with open(os.path.join(fixture_dir, name), 'rb') as f:
+                self.payloads[name] = f.read()
+            path = index.get(name, {}).get('path') or '/' + name.rsplit('-', 1)[0].removesuffix('.json').replace('_', '/')
+            # the first fixture recorded for a path answers requests with other params
+            self.by_path.setdefault(path, name)
+
+    def template(self, path):
+        name = self.by_path.get(path)
+        return json.loads(self.payloads[name]) if name else None
+
+    def lookup(self, path, params):
+        if path == '/coins/markets' and self.coins:
+            return json.dumps(self.synthetic_markets(params)).encode()
+        if path == '/coins/categories' and self.categories:
+            return json.dumps(self.synthetic_items(self.template(path) or [], self.categories)).encode()
+        name = fixture_name(path, params)
+        if name in self.payloads:
+            return self.payloads[name]
+        name = self.by_path.get(path)
+        return self.payloads[name] if name else None
+
+    def synthetic_markets(self, params):
+        # only the requested page is built, so a 15k-coin universe costs nothing up front
+        templates = self.template('/coins/markets') or [{'id': 'coin', 'symbol': 'coin', 'name': 'Coin',
+                                                         'current_price': 1.0, 'market_cap': 1e9,
+                                                         'total_volume': 1e7}]
+        per_page = int(params.get('per_page', 100))
+        page = int(params.get('page', 1))
+        start = (page - 1) * per_page
+        stop = min(start + per_page, self.coins)
+        return [self.synthetic_coin(templates[i % len(templates)], i) for i in range(start, stop)]
+
+    @staticmethod
+    def synthetic_coin(template, n):
+        coin = dict(template)
+        rng = random.Random(n)
+        scale = 1.0 / (1 + n / 50)
+        coin['id'] = f"{template.get('id')}-{n}"
+        coin['symbol'] = f"{template.get('symbol')}{n}"
+        coin['name'] = f"{template.get('name')} {n}"
+        coin['market_cap_rank'] = n + 1
+        for field in ('market_cap', 'total_volume', 'fully_diluted_valuation'):
+            if isinstance(template.get(field), (int, float)):
+                coin[field] = template[field] * scale
+        for field in ('price_change_percentage_24h', 'market_cap_change_percentage_24h',
+                      'price_change_percentage_1h_in_currency', 'price_change_percentage_7d_in_currency'):
+            coin[field] = round(rng.uniform(-15, 15), 4)
+        return coin
+
+    @staticmethod
+    def synthetic_items(templates, count):
+        items = []
+        for n in range(count):
+            item = dict(templates[n % len(templates)]) if templates else {}
+            item['id'] = f"{item.get('id', 'item')}-{n}"
+            item['name'] = f"{item.get('name', 'Item')} {n}"
+            items.append(item)
+        return items
+
+
+def make_handler(store, latency=0.0, jitter=0.0, error_rate=0.0, retry_after=1):
+    class ReplayHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+        def do_GET(self):
+            if latency or jitter:
+                time.sleep(latency + random.uniform(0, jitter))
+            if error_rate and random.random() < error_rate:
+                self.send_error_json(429, {'error': 'rate limited (injected)'}, {'Retry-After': str(retry_after)})
+                return
+
+            parts = urlsplit(self.path)
+            body = store.lookup(endpoint_path(parts.path), dict(parse_qsl(parts.query)))
+            if body is None:
+                self.send_error_json(404, {'error': f'no fixture for {parts.path}'})
+                return
+
+            etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'max-age=0')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_error_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug(format % args)
+
+    return ReplayHandler
+
+
+def start_server(fixture_dir, host='127.0.0.1', port=8765, coins=None, categories=None,
+                 latency=0.0, jitter=0.0, error_rate=0.0):
+    # returns the running server and the base url to use as COINGECKO_API_URL
+    store = FixtureStore(fixture_dir, coins=coins, categories=categories)
+    server = ThreadingHTTPServer((host, port), make_handler(store, latency, jitter, error_rate))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="replay-server", daemon=True).start()
+    return server, f"http://{host}:{server.server_port}{API_PREFIX}"
+
+
+def record(record_dir):
+    from data import api_client
+    for path, params in RECORD_ENDPOINTS:
+        response = api_client.get(f"{api_client.COINGECKO_API}{path}", params=params)
+        if response.status_code == 200:
+            record_response(f"{api_client.COINGECKO_API}{path}", params, response.content, record_dir)
+        else:
+            print(f"Skipping {path}: status {response.status_code}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record CoinGecko responses or replay them from a local server")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = commands.add_parser('record', help="capture live responses into a fixture directory")
+    record_parser.add_argument('--out', default='fixtures')
+
+    serve_parser = commands.add_parser('serve', help="serve recorded fixtures")
+    serve_parser.add_argument('--fixtures', default='fixtures')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8765)
+    serve_parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    serve_parser.add_argument('--jitter', type=float, default=0.0, help="random extra latency up to this many seconds")
+    serve_parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with 429")
+    serve_parser.add_argument('--coins', type=int, help="synthesise a /coins/markets universe of this size")
+    serve_parser.add_argument('--categories', type=int, help="synthesise this many /coins/categories entries")
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record(args.out)
+        return
+
+    server, base_url = start_server(args.fixtures, args.host, args.port, args.coins, args.categories,
+                                    args.latency, args.jitter, args.error_rate)
+    print(f"Replaying {args.fixtures} at {base_url} (set COINGECKO_API_URL to use it)")
+    try:
+        while True:
+            time.sleep(10)
+    except (KeyboardInterrupt, SystemExit):
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import os
+from datetime import datetime, timedelta
+
+
+# Market data rolled up into OHLC buckets as each snapshot lands, so long chart ranges never scan raw history.
+# A snapshot only touches the one 1h and one 1d bucket it falls in, existing buckets are merged, never rebuilt.
+
+RESOLUTIONS = {
+    '1h': timedelta(hours=1),
+    '1d': timedelta(days=1),
+}
+# snapshot field -> rollup column prefix, each gets _open/_high/_low/_close
+OHLC_FIELDS = {
+    'current_price': 'price',
+    'market_cap': 'market_cap',
+}
+VOLUME_FIELD = 'total_volume'
+
+# spacing assumed for raw snapshots when sizing a range, charts stay under MAX_CHART_POINTS per coin
+RAW_INTERVAL = timedelta(minutes=int(os.getenv('ROLLUP_RAW_INTERVAL_MINUTES', 5)))
+MAX_CHART_POINTS = int(os.getenv('ROLLUP_MAX_CHART_POINTS', 1000))
+
+
+def bucket_start(timestamp: datetime, resolution):
+    step = RESOLUTIONS[resolution]
+    epoch = datetime(1970, 1, 1)
+    return epoch + ((timestamp - epoch) // step) * step
+
+
+def choose_resolution(start: datetime, end: datetime = None):
+    # the finest data whose point count over the range fits the chart, 'raw' reads the history table
+    span = (end or datetime.utcnow()) - start
+    if span / RAW_INTERVAL <= MAX_CHART_POINTS:
+        return 'raw'
+    for resolution, step in RESOLUTIONS.items():
+        if span / step <= MAX_CHART_POINTS:
+            return resolution
+    return list(RESOLUTIONS)[-1]
+
+
+def new_bucket(row, timestamp):
+    bucket = {'first_at': timestamp, 'last_at': timestamp, 'samples': 1,
+              'volume_sum': row.get(VOLUME_FIELD), 'volume': row.get(VOLUME_FIELD)}
+    for field, prefix in OHLC_FIELDS.items():
+        value = row.get(field)
+        bucket.update({f"{prefix}_open": value, f"{prefix}_high": value,
+                       f"{prefix}_low": value, f"{prefix}_close": value})
+    return bucket
+
+
+def _extreme(function, current, value):
+    values = [v for v in (current, value) if v is not None]
+    return function(values) if values else None
+
+
+def merge_bucket(bucket, row, timestamp):
+    # fold one more snapshot into a stored bucket, snapshots may arrive out of order
+    merged = dict(bucket)
+    for field, prefix in OHLC_FIELDS.items():
+        value = row.get(field)
+        if value is None:
+            continue
+        merged[f"{prefix}_high"] = _extreme(max, bucket[f"{prefix}_high"], value)
+        merged[f"{prefix}_low"] = _extreme(min, bucket[f"{prefix}_low"], value)
+        if timestamp < bucket['first_at'] or bucket[f"{prefix}_open"] is None:
+            merged[f"{prefix}_open"] = value
+        if timestamp >= bucket['last_at'] or bucket[f"{prefix}_close"] is None:
+            merged[f"{prefix}_close"] = value
+    merged['first_at'] = min(bucket['first_at'], timestamp)
+    merged['last_at'] = max(bucket['last_at'], timestamp)
+    merged['samples'] = (bucket['samples'] or 0) + 1
+    volume = row.get(VOLUME_FIELD)
+    if volume is not None:
+        # total_volume is already a rolling 24h figure, the bucket keeps its average rather than a sum
+        merged['volume_sum'] = (bucket['volume_sum'] or 0) + volume
+        merged['volume'] = merged['volume_sum'] / merged['samples']
+    return merged
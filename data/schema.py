@@ -0,0 +1,75 @@
+import argparse
+import logging
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from data import db_manager
+
+
+# Index checks for the ranking queries over market_data. The top-N tables themselves are written from the
+# in-memory market batch in the same transaction as market_data (see data.leaderboard), nothing re-sorts the table.
+#   python -m data.schema --check-plans     EXPLAIN the ranking queries and fail if one is not index-backed
+
+# queries whose plans must use an index, name -> (statement, index expected in the plan)
+RANKING_QUERIES = {
+    'top_gainers': (db_manager.top_gainers_query, 'ix_market_data_mcap_change_24h'),
+    'top_volume': (db_manager.top_volume_query, 'ix_market_data_total_volume'),
+}
+
+
+def is_postgres(bind):
+    return bind.dialect.name == 'postgresql'
+
+
+def explain(connection, statement):
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True})
+    if is_postgres(connection):
+        # small tables are cheaper to scan, disable seq scans so the plan shows whether an index *can* serve it
+        connection.execute(text("SET LOCAL enable_seqscan = off"))
+        rows = connection.execute(text(f"EXPLAIN {compiled}"))
+        return '\n'.join(row[0] for row in rows)
+    rows = connection.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))
+    return '\n'.join(str(row[-1]) for row in rows)
+
+
+def check_query_plans():
+    # returns a list of problems, empty when every ranking query is served by its index without a sort
+    problems = []
+    with db_manager.engine.connect() as connection:
+        for name, (build_query, index_name) in RANKING_QUERIES.items():
+            with connection.begin():
+                plan = explain(connection, build_query())
+                if index_name not in plan:
+                    problems.append(f"{name}: plan does not use {index_name}\n{plan}")
+                elif 'Sort' in plan or 'TEMP B-TREE' in plan:
+                    problems.append(f"{name}: plan sorts instead of reading {index_name} in order\n{plan}")
+    return problems
+
+
+def report_query_plans():
+    # run at ingest and scheduler startup, a missing or unused index is logged instead of found in production
+    try:
+        problems = check_query_plans()
+    except SQLAlchemyError as e:
+        logging.warning(f"Query plan check could not run: {e}")
+        return None
+    for problem in problems:
+        logging.warning(f"Query plan check: {problem}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard schema maintenance")
+    parser.add_argument('--check-plans', action='store_true', help="fail if a ranking query is not index-backed")
+    args = parser.parse_args()
+
+    db_manager.initialize_db()
+    if args.check_plans:
+        problems = check_query_plans()
+        for problem in problems:
+            print(problem)
+        print("Query plans OK" if not problems else f"{len(problems)} query plan problem(s)")
+        raise SystemExit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
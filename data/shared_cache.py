@@ -0,0 +1,182 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+
+
+# Cross-process cache on a local SQLite file (WAL mode, no server). Every worker of a multi-process deployment
+# opens the same file, so a dataset or API response fetched by one worker is reused by all of them.
+# Enable with CACHE_BACKEND=shared; SHARED_CACHE_PATH picks the file.
+
+ENABLED = os.getenv('CACHE_BACKEND', 'local').lower() == 'shared'
+SHARED_CACHE_PATH = os.getenv('SHARED_CACHE_PATH', os.path.join('cache', 'shared.sqlite3'))
+SHARED_CACHE_MAX_BYTES = int(float(os.getenv('SHARED_CACHE_MAX_MB', 512)) * 1024 * 1024)
+DEFAULT_TTL = 3600
+# last-access times are only rewritten this often, so reads stay read-only on the hot path
+TOUCH_INTERVAL = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+)
+"""
+
+_local = threading.local()
+
+
+def connect(path):
+    # one connection per thread and process, a forked worker never reuses its parent's handle
+    connections = getattr(_local, 'connections', None)
+    if connections is None or _local.pid != os.getpid():
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+    connection = connections.get(path)
+    if connection is None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(path, timeout=10, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(SCHEMA)
+        connection.execute("CREATE INDEX IF NOT EXISTS ix_cache_entries_accessed ON cache_entries (accessed)")
+        connections[path] = connection
+    return connection
+
+
+class SharedCache(MutableMapping):
+    # get/set/delete like cache_manager.TwoTierCache, and a mapping so it can stand in for a TTLCache
+    def __init__(self, namespace, ttl=DEFAULT_TTL, path=None, max_bytes=SHARED_CACHE_MAX_BYTES):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.path = path or SHARED_CACHE_PATH
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.stats_counters = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    @property
+    def connection(self):
+        return connect(self.path)
+
+    @staticmethod
+    def encode_key(key):
+        return key if isinstance(key, str) else repr(key)
+
+    def _count(self, name, amount=1):
+        with self.lock:
+            self.stats_counters[name] += amount
+
+    def get(self, key, default=None):
+        now = time.time()
+        row = self.connection.execute(
+            "SELECT value, expires_at, accessed FROM cache_entries WHERE namespace = ? AND key = ?",
+            (self.namespace, self.encode_key(key))).fetchone()
+        if row is None or row[1] <= now:
+            self._count("misses")
+            return default
+        if now - row[2] > TOUCH_INTERVAL:
+            self.connection.execute("UPDATE cache_entries SET accessed = ? WHERE namespace = ? AND key = ?",
+                                    (now, self.namespace, self.encode_key(key)))
+        self._count("hits")
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self.connection.execute(
+            "INSERT OR REPLACE INTO cache_entries (namespace, key, value, size, expires_at, accessed) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (self.namespace, self.encode_key(key), blob, len(blob), now + (self.ttl if ttl is None else ttl), now))
+        self._count("writes")
+        self.evict()
+
+    def add(self, key, value, ttl=None):
+        # atomic across processes: stores the value only if the key is absent or expired, returns whether it did
+        now = time.time()
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        cursor = self.connection.execute(
+            "INSERT INTO cache_entries (namespace, key, value, size, expires_at, accessed) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+            "expires_at = excluded.expires_at, accessed = excluded.accessed WHERE cache_entries.expires_at <= ?",
+            (self.namespace, self.encode_key(key), blob, len(blob), now + (self.ttl if ttl is None else ttl), now, now))
+        return cursor.rowcount == 1
+
+    def delete(self, key):
+        self.connection.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+                                (self.namespace, self.encode_key(key)))
+
+    def clear(self):
+        self.connection.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+
+    def evict(self):
+        # expired rows of every namespace first, then the least recently used until the file fits
+        connection = self.connection
+        connection.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),))
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for namespace, key, size in connection.execute(
+                "SELECT namespace, key, size FROM cache_entries ORDER BY accessed").fetchall():
+            if total <= self.max_bytes:
+                break
+            connection.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (namespace, key))
+            total -= size
+            evicted += 1
+        self._count("evictions", evicted)
+
+    def purge_expired(self):
+        self.evict()
+
+    # mapping interface
+
+    def __getitem__(self, key):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        self.delete(key)
+
+    def __contains__(self, key):
+        return self.connection.execute(
+            "SELECT 1 FROM cache_entries WHERE namespace = ? AND key = ? AND expires_at > ?",
+            (self.namespace, self.encode_key(key), time.time())).fetchone() is not None
+
+    def __iter__(self):
+        rows = self.connection.execute("SELECT key FROM cache_entries WHERE namespace = ? AND expires_at > ?",
+                                       (self.namespace, time.time())).fetchall()
+        return iter([row[0] for row in rows])
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM cache_entries WHERE namespace = ? AND expires_at > ?",
+                                       (self.namespace, time.time())).fetchone()[0]
+
+    def stats(self):
+        entries, size = self.connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ? AND expires_at > ?",
+            (self.namespace, time.time())).fetchone()
+        with self.lock:
+            counters = dict(self.stats_counters)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "namespace": self.namespace,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hit_ratio": round(counters["hits"] / lookups, 3) if lookups else 0.0,
+        }
@@ -0,0 +1,128 @@
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from data import cache_manager
+
+
+# Stale-while-revalidate on top of cache_manager: a reader always gets the last good value straight away,
+# a refresh runs in the background once it is older than `fresh`, and values older than `max_stale` are not served.
+
+Policy = namedtuple('Policy', ['fresh', 'max_stale'])  # seconds
+
+DEFAULT_POLICY = Policy(fresh=300, max_stale=3600)
+DATASET_POLICIES = {
+    'market_data': Policy(fresh=120, max_stale=1800),
+    'global_data': Policy(fresh=300, max_stale=3600),
+    'market_dominance': Policy(fresh=300, max_stale=3600),
+    'trending_data': Policy(fresh=600, max_stale=7200),
+    'category_data': Policy(fresh=1800, max_stale=6 * 3600),
+}
+REFRESH_WORKERS = 2
+# with a cross-process cache, one worker at a time refreshes a dataset and holds the lease for at most this long
+REFRESH_LEASE_SECONDS = 60
+
+
+class StaleWhileRevalidate:
+    def __init__(self, loader, cache=None, policies=None, workers=REFRESH_WORKERS):
+        # loader(name) returns a fresh value, or None when the upstream call failed
+        self.loader = loader
+        self.cache = cache or cache_manager.cache
+        self.policies = policies or DATASET_POLICIES
+        self.workers = workers
+        self.executor = None
+        self.lock = threading.Lock()
+        self.refreshing = {}  # name -> Future of the running refresh
+        self.stats_counters = {"fresh": 0, "stale": 0, "missing": 0, "refreshes": 0, "refresh_failures": 0}
+
+    def policy(self, name):
+        return self.policies.get(name, DEFAULT_POLICY)
+
+    def key(self, name):
+        return f"swr:{name}"
+
+    def put(self, name, value):
+        # also used by ingestion so every successful fetch keeps the served value current
+        if value is None:
+            return
+        self.cache.set(self.key(name), {'value': value, 'fetched_at': time.time()}, ttl=self.policy(name).max_stale)
+
+    def age(self, name):
+        entry = self.cache.get(self.key(name))
+        return time.time() - entry['fetched_at'] if entry else None
+
+    def peek(self, name):
+        # (value, age in seconds) of the servable entry, or (None, None); never starts a refresh
+        entry = self.cache.get(self.key(name))
+        if entry is None:
+            return None, None
+        return entry['value'], time.time() - entry['fetched_at']
+
+    def get(self, name, default=None, wait=False):
+        # never blocks on the upstream API unless wait=True and there is nothing servable
+        entry = self.cache.get(self.key(name))
+        if entry is None:
+            with self.lock:
+                self.stats_counters["missing"] += 1
+            future = self.refresh(name)
+            if wait:
+                future.result()
+                entry = self.cache.get(self.key(name))
+            return entry['value'] if entry else default
+
+        if time.time() - entry['fetched_at'] < self.policy(name).fresh:
+            with self.lock:
+                self.stats_counters["fresh"] += 1
+        else:
+            with self.lock:
+                self.stats_counters["stale"] += 1
+            self.refresh(name)
+        return entry['value']
+
+    def refresh(self, name):
+        # at most one refresh per dataset in flight, concurrent readers share it
+        with self.lock:
+            future = self.refreshing.get(name)
+            if future is not None:
+                return future
+            if hasattr(self.cache, 'add') and not self.cache.add(f"lease:{name}", os.getpid(),
+                                                                  ttl=REFRESH_LEASE_SECONDS):
+                # another worker is refreshing it, its result lands in the shared cache
+                future = Future()
+                future.set_result(None)
+                return future
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='swr-refresh')
+            future = self.executor.submit(self._refresh, name)
+            self.refreshing[name] = future
+            return future
+
+    def _refresh(self, name):
+        try:
+            value = self.loader(name)
+            if value is None:
+                # keep serving the last good value, the next stale read tries again
+                with self.lock:
+                    self.stats_counters["refresh_failures"] += 1
+                logging.warning(f"Background refresh of {name} failed, serving the last good value")
+                return None
+            self.put(name, value)
+            with self.lock:
+                self.stats_counters["refreshes"] += 1
+            return value
+        except Exception as e:
+            with self.lock:
+                self.stats_counters["refresh_failures"] += 1
+            logging.error(f"Background refresh of {name} raised: {e}")
+            return None
+        finally:
+            if hasattr(self.cache, 'add'):
+                self.cache.delete(f"lease:{name}")
+            with self.lock:
+                self.refreshing.pop(name, None)
+
+    def stats(self):
+        with self.lock:
+            return {**self.stats_counters, "refreshing": sorted(self.refreshing)}
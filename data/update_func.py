@@ -1,86 +1,198 @@
+import logging
+import os
+import random
+import statistics
 import time
+from collections import deque, namedtuple
+from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 
 
-# TODO do it later
-def update_market_data():
+# Each job is rescheduled after every run: volatile data is refreshed sooner, unchanged data later,
+# and every interval is stretched when the planned call rate would not fit the API budget.
+
+# scheduled job -> datasets it refreshes in one cycle; global_data and market_dominance are both read from
+# /global, one job downloads it once for both instead of two jobs that never fall in the coalesce window
+JOB_DATASETS = {
+    'market_data': ['market_data'],
+    'global_data': ['global_data', 'market_dominance'],
+    'trending_data': ['trending_data'],
+    'category_data': ['category_data'],
+}
+
+# job -> refresh interval bounds in minutes, market data is kept much fresher than categories
+RefreshPolicy = namedtuple('RefreshPolicy', ['min_minutes', 'base_minutes', 'max_minutes'])
+REFRESH_POLICIES = {
+    'market_data': RefreshPolicy(5, 15, 60),
+    'global_data': RefreshPolicy(10, 30, 120),
+    'trending_data': RefreshPolicy(15, 60, 240),
+    'category_data': RefreshPolicy(60, 240, 720),
+}
+# moves treated as "normal" activity (1.0): median 1h coin move and 24h total market cap change, in percent
+MARKET_REFERENCE_MOVE = 0.5
+GLOBAL_REFERENCE_MOVE = 3.0
+# activity of a run whose data did not change upstream
+UNCHANGED_ACTIVITY = 0.5
+ACTIVITY_WINDOW = 6
+# the scheduler plans for at most this share of the rate limit, the rest is left for ingestion runs and retries
+BUDGET_SHARE = 0.5
+# optional monthly plan quota (e.g. 10000 on the demo plan), 0 disables it
+MONTHLY_CALL_BUDGET = int(os.getenv('COINGECKO_MONTHLY_CALLS', 0))
+JITTER_FRACTION = 0.1
+START_STAGGER_SECONDS = 30
+
+scheduler = None
+intervals = {}  # job -> current interval in minutes
+activity = {name: deque(maxlen=ACTIVITY_WINDOW) for name in REFRESH_POLICIES}
+_month_start_calls = None
+
+
+def market_activity(payload):
+    moves = [abs(coin.get('price_change_percentage_1h_in_currency') or 0) for coin in payload or []]
+    return statistics.median(moves) / MARKET_REFERENCE_MOVE if moves else None
+
+
+def global_activity(payload):
+    change = ((payload or {}).get('data') or {}).get('market_cap_change_percentage_24h_usd')
+    return abs(change) / GLOBAL_REFERENCE_MOVE if change is not None else None
+
+
+# job -> measure of how much its first dataset's payload moved, jobs without one count any change as 1.0
+ACTIVITY_FUNCTIONS = {
+    'market_data': market_activity,
+    'global_data': global_activity,
+}
+
+
+def record_activity(name, payload, unchanged):
+    if unchanged:
+        activity[name].append(UNCHANGED_ACTIVITY)
+        return
+    if not payload:
+        return  # failed run, keep the current interval
+    measure = ACTIVITY_FUNCTIONS.get(name)
+    value = measure(payload) if measure else 1.0
+    if value is not None:
+        activity[name].append(min(max(value, 0.25), 4.0))
+
+
+def budget_calls_per_minute():
+    # calls per minute the schedule may plan for, from the rate limit and what is left of the monthly quota
+    from data.api_client import limiter
+    global _month_start_calls
+    budget = limiter.stats()['calls_per_minute'] * BUDGET_SHARE
+    if MONTHLY_CALL_BUDGET:
+        now = datetime.utcnow()
+        if _month_start_calls is None or _month_start_calls[0] != (now.year, now.month):
+            _month_start_calls = ((now.year, now.month), limiter.calls)
+        used = limiter.calls - _month_start_calls[1]  # calls made by this process since the month started
+        next_month = (now.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        minutes_left = max((next_month - now).total_seconds() / 60, 1)
+        budget = min(budget, max(MONTHLY_CALL_BUDGET - used, 0) / minutes_left)
+    return budget
+
+
+def next_interval(name):
+    policy = REFRESH_POLICIES[name]
+    recent = activity[name]
+    level = statistics.mean(recent) if recent else 1.0
+    minutes = min(max(policy.base_minutes / level, policy.min_minutes), policy.max_minutes)
+
+    # stretch everything proportionally when the planned call rate is over budget
+    planned = {**intervals, name: minutes}
+    calls_per_minute = sum(1 / value for value in planned.values())
+    budget = budget_calls_per_minute()
+    if budget <= 0:
+        return policy.max_minutes
+    if calls_per_minute > budget:
+        minutes *= calls_per_minute / budget
+    from data.api_client import limiter
+    if limiter.stats()['paused_for_seconds'] > 0:
+        minutes *= 2  # upstream is rate limiting right now, back off
+    return min(minutes, policy.max_minutes * 4)
+
+
+def make_trigger(minutes, start_date=None):
+    # jitter keeps datasets that share an interval from firing in the same instant
+    jitter = max(int(minutes * 60 * JITTER_FRACTION), 1)
+    return IntervalTrigger(minutes=minutes, jitter=jitter, start_date=start_date)
+
+
+def reschedule(name):
+    minutes = round(next_interval(name), 2)
+    if scheduler is not None and minutes != intervals.get(name):
+        scheduler.reschedule_job(f"update_{name}", trigger=make_trigger(minutes))
+        logging.info(f"{name}: next refresh in ~{minutes} minutes (activity {list(activity[name])})")
+    intervals[name] = minutes
+
+
+def run_update(name):
     # local import to avoid circular dependency
-    from data.fetch_data import fetch_market_data
-    fetch_market_data()
+    from data import refresh_dag
+    # same graph as a full refresh, so partitions and history retention follow every scheduled write
+    datasets = JOB_DATASETS[name]
+    results = refresh_dag.run_refresh_dag(datasets, workers=2)
+    fetched = results[f'fetch:{datasets[0]}']
+    record_activity(name, fetched.value, unchanged=fetched.status == refresh_dag.UNCHANGED)
+    reschedule(name)
+
+
+def update_market_data():
+    run_update('market_data')
 
 
 def update_global_data():
-    # local import to avoid circular dependency
-    from data.fetch_data import fetch_global_data
-    fetch_global_data()
+    # also refreshes market dominance from the same /global download
+    run_update('global_data')
 
 
 def update_trending_data():
-    # local import to avoid circular dependency
-    from data.fetch_data import fetch_trending_data
-    fetch_trending_data()
+    run_update('trending_data')
 
 
 def update_category_data():
-    # local import to avoid circular dependency
-    from data.fetch_data import fetch_category_data
-    fetch_category_data()
+    run_update('category_data')
 
 
-def update_market_dominance():
-    # local import to avoid circular dependency
-    from data.fetch_data import fetch_market_dominance
-    fetch_market_dominance()
+UPDATE_FUNCTIONS = {
+    'market_data': update_market_data,
+    'global_data': update_global_data,
+    'trending_data': update_trending_data,
+    'category_data': update_category_data,
+}
 
 
 def start_scheduler():
+    # local import to avoid circular dependency
+    from data import db_manager, history, schema
+    global scheduler
+    db_manager.initialize_db()
+    history.ensure_partitions()
+    schema.report_query_plans()
     scheduler = BackgroundScheduler()
 
-    # Set up individual schedules for each table update function
-    scheduler.add_job(
-        update_market_data,
-        trigger=IntervalTrigger(minutes=240),
-        id="update_market_data",
-        name="Updates market data every 240 minutes",
-        replace_existing=True
-    )
-
-    scheduler.add_job(
-        update_global_data,
-        trigger=IntervalTrigger(minutes=240),
-        id="update_global_data",
-        name="Updates global data every 240 minutes",
-        replace_existing=True
-    )
-
-    scheduler.add_job(
-        update_trending_data,
-        trigger=IntervalTrigger(minutes=240),
-        id="update_trending_data",
-        name="Updates trending coins data every 240 minutes",
-        replace_existing=True
-    )
-
-    scheduler.add_job(
-        update_category_data,
-        trigger=IntervalTrigger(minutes=240),
-        id="update_category_data",
-        name="Updates category data every 240 minutes",
-        replace_existing=True
-    )
-
-    scheduler.add_job(
-        update_market_dominance,
-        trigger=IntervalTrigger(minutes=240),
-        id="update_market_dominance",
-        name="Updates market dominance data every 240 minutes",
-        replace_existing=True
-    )
+    # Set up individual schedules for each table update function, staggered so they do not start together
+    now = datetime.now()
+    for offset, (name, update) in enumerate(UPDATE_FUNCTIONS.items()):
+        minutes = REFRESH_POLICIES[name].base_minutes
+        intervals[name] = minutes
+        start = now + timedelta(seconds=offset * START_STAGGER_SECONDS + random.uniform(0, START_STAGGER_SECONDS))
+        scheduler.add_job(
+            update,
+            trigger=make_trigger(minutes, start_date=start),
+            id=f"update_{name}",
+            name=f"Updates {', '.join(dataset.replace('_', ' ') for dataset in JOB_DATASETS[name])} "
+                 f"(adaptive, starts every {minutes} minutes)",
+            replace_existing=True,
+            max_instances=1,  # a slow run is never overlapped by the next one
+            coalesce=True,  # runs missed while busy collapse into one
+            misfire_grace_time=int(minutes * 30),
+        )
 
     # start the scheduler
     scheduler.start()
-    print("Scheduler started. Tables will be updated every 240 minutes.")
+    print("Scheduler started. Refresh intervals adapt to market activity and the API budget.")
     # keep the scheduler running
     try:
         while True:
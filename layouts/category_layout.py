@@ -2,7 +2,8 @@ from dash import Dash, html, dash_table, dcc
 import dash_bootstrap_components as dbc
 import pandas as pd
 import plotly.graph_objs as go
-from utils.chart_helpers import categories_df
+from utils.chart_helpers import fetch_data_from_db
+from data.query_cache import per_generation
 import json
 import plotly.express as px
 import dash
@@ -112,14 +113,16 @@ def generate_category_table(categories_df):
 
     return html.Div([category_table])
 
-categories_df = parse_data(categories_df)
 
-bar_chart_fig = generate_category_visualization(categories_df)
-category_table = generate_category_table(categories_df)
+@per_generation
+def category_layout():
+    categories_df = parse_data(fetch_data_from_db()[6])
 
+    bar_chart_fig = generate_category_visualization(categories_df)
+    category_table = generate_category_table(categories_df)
 
-category_layout = html.Div([
-    html.H4("Top 30 Categories by Market Cap"),
-    category_table,
-    dcc.Graph(figure=bar_chart_fig),
-])
+    return html.Div([
+        html.H4("Top 30 Categories by Market Cap"),
+        category_table,
+        dcc.Graph(figure=bar_chart_fig),
+    ])
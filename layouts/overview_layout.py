@@ -1,12 +1,17 @@
 from dash import html
-from utils.chart_helpers import market_df, create_market_table
+from utils.chart_helpers import fetch_data_from_db, create_market_table
+from data.query_cache import per_generation
 import dash_bootstrap_components as dbc
 
-overview_layout = html.Div([
-    dbc.Row([
-        dbc.Col([
-            html.H4("Cryptocurrency Market Overview", className="text-center my-4"),
-            html.Div([create_market_table(market_df)])  # Ensure the function returns a valid DataTable component
+
+@per_generation
+def overview_layout():
+    market_df = fetch_data_from_db()[0]
+    return html.Div([
+        dbc.Row([
+            dbc.Col([
+                html.H4("Cryptocurrency Market Overview", className="text-center my-4"),
+                html.Div([create_market_table(market_df)])  # Ensure the function returns a valid DataTable component
+            ])
         ])
     ])
-])
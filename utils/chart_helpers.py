@@ -6,149 +6,67 @@ import dash
 import pandas as pd
 import requests
 import json
+from sqlalchemy import select, func
 from data.db_manager import (
-    SessionLocal, MarketData, TopGainersMarketCap, TopProjectsByVolume,
+    MarketData, TopGainersMarketCap, TopProjectsByVolume,
     GlobalData, MarketDominance, TrendingCoins, Categories
 )
+from data.query_cache import cached_frames
+
+# stablecoins are left out of the gainers and volume rankings
+EXCLUDED_SYMBOLS = ['usdt', 'usdc']
+
+# columns each dashboard frame needs, roi and sparkline_in_7d are never read
+MARKET_COLUMNS = [
+    'id', 'symbol', 'name', 'image', 'current_price', 'market_cap', 'market_cap_rank', 'fully_diluted_valuation',
+    'total_volume', 'high_24h', 'low_24h', 'price_change_24h', 'price_change_percentage_24h', 'market_cap_change_24h',
+    'market_cap_change_percentage_24h', 'circulating_supply', 'total_supply', 'max_supply', 'ath',
+    'ath_change_percentage', 'ath_date', 'atl', 'atl_change_percentage', 'atl_date', 'last_updated',
+    'price_change_percentage_1h', 'timestamp',
+]
+GAINERS_COLUMNS = [
+    'id', 'name', 'symbol', 'price', 'change_24h', 'percent_change_7d', 'market_cap_change_percentage_24h',
+    'market_cap', 'market_cap_dominance', 'date_added', 'data_period', 'timestamp',
+]
+VOLUME_COLUMNS = ['id', 'name', 'symbol', 'total_volume', 'market_cap', 'last_updated', 'timestamp']
+GLOBAL_COLUMNS = [
+    'id', 'active_cryptocurrencies', 'upcoming_icos', 'ongoing_icos', 'ended_icos', 'markets', 'total_market_cap',
+    'total_volume', 'market_cap_percentage', 'market_cap_change_percentage_24h_usd', 'updated_at', 'timestamp',
+]
+DOMINANCE_COLUMNS = ['id', 'btc', 'eth', 'usdt', 'usdc', 'bnb', 'sol', 'xrp', 'others', 'timestamp']
+TRENDING_COLUMNS = [
+    'id', 'coin_id', 'coin_name', 'symbol', 'market_cap_rank', 'small', 'score', 'price', 'market_cap',
+    'total_volume', 'timestamp',
+]
+CATEGORIES_COLUMNS = [
+    'id', 'category_id', 'name', 'market_cap', 'market_cap_24h_change', 'top_3_coins', 'volume_24h', 'timestamp',
+]
+
+
+def columns_of(model, names):
+    return [model.__table__.c[name] for name in names]
+
+
+def dashboard_queries():
+    return {
+        'market': select(*columns_of(MarketData, MARKET_COLUMNS)),
+        'gainers': select(*columns_of(TopGainersMarketCap, GAINERS_COLUMNS)).where(
+            TopGainersMarketCap.data_period == '24h',
+            func.lower(TopGainersMarketCap.symbol).notin_(EXCLUDED_SYMBOLS)),
+        'volume': select(*columns_of(TopProjectsByVolume, VOLUME_COLUMNS)).where(
+            func.lower(TopProjectsByVolume.symbol).notin_(EXCLUDED_SYMBOLS)),
+        'global': select(*columns_of(GlobalData, GLOBAL_COLUMNS)),
+        'dominance': select(*columns_of(MarketDominance, DOMINANCE_COLUMNS)),
+        'trending': select(*columns_of(TrendingCoins, TRENDING_COLUMNS)),
+        'categories': select(*columns_of(Categories, CATEGORIES_COLUMNS)),
+    }
+
 
 def fetch_data_from_db():
-    session = SessionLocal()
-    try:
-        # Fetch Market Data
-        market_data = session.query(MarketData).all()
-        market_df = pd.DataFrame([{
-            'id': coin.id,
-            'symbol': coin.symbol,
-            'name': coin.name,
-            'image': coin.image,
-            'current_price': coin.current_price,
-            'market_cap': coin.market_cap,
-            'market_cap_rank': coin.market_cap_rank,
-            'fully_diluted_valuation': coin.fully_diluted_valuation,
-            'total_volume': coin.total_volume,
-            'high_24h': coin.high_24h,
-            'low_24h': coin.low_24h,
-            'price_change_24h': coin.price_change_24h,
-            'price_change_percentage_24h': coin.price_change_percentage_24h,
-            'market_cap_change_24h': coin.market_cap_change_24h,
-            'market_cap_change_percentage_24h': coin.market_cap_change_percentage_24h,
-            'circulating_supply': coin.circulating_supply,
-            'total_supply': coin.total_supply,
-            'max_supply': coin.max_supply,
-            'ath': coin.ath,
-            'ath_change_percentage': coin.ath_change_percentage,
-            'ath_date': coin.ath_date,
-            'atl': coin.atl,
-            'atl_change_percentage': coin.atl_change_percentage,
-            'atl_date': coin.atl_date,
-            # 'roi': coin.roi,
-            'last_updated': coin.last_updated,
-            'price_change_percentage_1h': coin.price_change_percentage_1h,
-            # 'sparkline_in_7d': coin.sparkline_in_7d,
-            'timestamp': coin.timestamp
-        } for coin in market_data])
-
-        # Fetch Top Gainers
-        top_gainers = session.query(TopGainersMarketCap).all()
-        gainers_df = pd.DataFrame([{
-            'id': gainer.id,
-            'name': gainer.name,
-            'symbol': gainer.symbol,
-            'price': gainer.price,
-            'change_24h': gainer.change_24h,
-            'percent_change_7d': gainer.percent_change_7d,
-            'market_cap_change_percentage_24h': gainer.market_cap_change_percentage_24h,
-            'market_cap': gainer.market_cap,
-            'market_cap_dominance': gainer.market_cap_dominance,
-            'date_added': gainer.date_added,
-            'data_period': gainer.data_period,
-            'timestamp': gainer.timestamp
-        } for gainer in top_gainers if gainer.symbol.lower() not in ['usdt', 'usdc']])
-
-        # Fetch Top Projects By Volume
-        top_volume = session.query(TopProjectsByVolume).all()
-        volume_df = pd.DataFrame([{
-            'id': project.id,
-            'name': project.name,
-            'symbol': project.symbol,
-            'total_volume': project.total_volume,
-            'market_cap': project.market_cap,
-            'last_updated': project.last_updated,
-            'timestamp': project.timestamp
-        } for project in top_volume if project.symbol.lower() not in ['usdt', 'usdc']])
-
-
-        # Fetch Global Data
-        global_data = session.query(GlobalData).all()
-        global_df = pd.DataFrame([{
-            'id': data.id,
-            'active_cryptocurrencies': data.active_cryptocurrencies,
-            'upcoming_icos': data.upcoming_icos,
-            'ongoing_icos': data.ongoing_icos,
-            'ended_icos': data.ended_icos,
-            'markets': data.markets,
-            'total_market_cap': data.total_market_cap,
-            'total_volume': data.total_volume,
-            'market_cap_percentage': data.market_cap_percentage,
-            'market_cap_change_percentage_24h_usd': data.market_cap_change_percentage_24h_usd,
-            'updated_at': data.updated_at,
-            'timestamp': data.timestamp
-        } for data in global_data])
-
-        # Fetch Market Dominance Data
-        dominance_data = session.query(MarketDominance).all()
-        dominance_df = pd.DataFrame([{
-            'id': dom.id,
-            'btc': dom.btc,
-            'eth': dom.eth,
-            'usdt': dom.usdt,
-            'usdc': dom.usdc,
-            'bnb': dom.bnb,
-            'sol': dom.sol,
-            'xrp': dom.xrp,
-            'others': dom.others,
-            'timestamp': dom.timestamp
-        } for dom in dominance_data])
-
-        # Fetch Trending Coins
-        trending_data = session.query(TrendingCoins).all()
-
-
-        trending_df = pd.DataFrame([{
-            'id': coin.id,
-            'coin_id': coin.coin_id,
-            'coin_name': coin.coin_name,
-            'symbol': coin.symbol,
-            'market_cap_rank': coin.market_cap_rank,
-            'small': coin.small,
-            'score': coin.score,
-            'price': coin.price,
-            'market_cap': coin.market_cap,
-            'total_volume': coin.total_volume,
-            'timestamp': coin.timestamp
-        } for coin in trending_data])
-
-
-        # Fetch Categories Data
-        category_data = session.query(Categories).all()
-        categories_df = pd.DataFrame([{
-            'id': category.id,
-            'category_id': category.category_id,
-            'name': category.name,
-            'market_cap': category.market_cap,
-            'market_cap_24h_change': category.market_cap_24h_change,
-            'top_3_coins': category.top_3_coins,
-            'volume_24h': category.volume_24h,
-            'timestamp': category.timestamp
-        } for category in category_data])
-
-        return market_df, gainers_df, volume_df, global_df, dominance_df, trending_df, categories_df
-
-    finally:
-        session.close()
-
-# Fetch data
-market_df, gainers_df, volume_df, global_df, dominance_df, trending_df, categories_df = fetch_data_from_db()
+    # served from the query cache until ingestion publishes a new data generation
+    frames = cached_frames(dashboard_queries())
+    return (frames['market'], frames['gainers'], frames['volume'], frames['global'], frames['dominance'],
+            frames['trending'], frames['categories'])
 
 
 def generate_global_charts(global_df):
@@ -262,9 +180,6 @@ def treemap(market_df):
     return fig
 
 
-dcc.Graph(figure=treemap(market_df), style={'height': '95vh', 'width': '84vw'})
-
-
 def format_currency(value):
     """Formats number as currency."""
     if pd.isnull(value):
@@ -505,12 +420,6 @@ def generate_global_overview(global_df):
     return cards, fig_market_cap, fig_volume
 
 
-global_cards, fig_market_cap, fig_volume = generate_global_overview(global_df)
-
-
-categories_df
-
-
 def parse_data(categories_df):
     # Parsing the JSON-like columns for icons
     categories_df['top_3_coins'] = categories_df['top_3_coins'].apply(lambda x: json.loads(x.replace("'", '"')))
@@ -520,8 +429,6 @@ def parse_data(categories_df):
     return categories_df
 
 
-categories = parse_data(categories_df)
-
 # 1. Treemap Visualization
 def create_treemap(categories):
     fig = px.treemap(categories,